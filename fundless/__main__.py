@@ -5,12 +5,11 @@ import logging
 import threading
 
 from trading import TradingBot
-from messages import TelegramBot
 from analytics import PortfolioAnalytics
 from config import Config
-from dashboard_app import Dashboard
 from exchanges import Exchanges
-from savings_plan_scheduler import SavingsPlanScheduler
+from snapshot_store import SnapshotStore
+from utils import StartupTimer
 
 """
 
@@ -20,6 +19,7 @@ orders and will possibly be able to rebalance after the one year waiting period
 
 """
 telegram_bot = True
+lazy_startup = True  # start the bots right away and load the analytics data in the background
 
 secrets_yaml = "secrets.yaml"
 config_yaml = "config.yaml"
@@ -35,38 +35,59 @@ if __name__ == "__main__":
     logger = logging.getLogger()
 
     logger.info("Hi, I will just buy and HODL!")
+    timer = StartupTimer()
 
     # parse all settings from yaml files
-    config = Config.from_yaml_files(config_yaml=config_yaml, secrets_yaml=secrets_yaml)
+    with timer.stage("config"):
+        config = Config.from_yaml_files(config_yaml=config_yaml, secrets_yaml=secrets_yaml)
 
     # initialize exchanges with api credentials from secrets file
     logger.info("Initializing exchanges...")
-    exchanges = Exchanges(config)
+    with timer.stage("exchanges"):
+        exchanges = Exchanges(config)
+
+    # in multi worker mode the dashboard runs in separate processes, reading the analytics data from a shared store
+    dashboard_workers = (
+        config.dashboard_config.dashboard
+        and config.dashboard_config.workers > 1
+        and "localhost" not in config.dashboard_config.domain_name
+    )
+    snapshot_store = SnapshotStore(config.dashboard_config.snapshot_directory) if dashboard_workers else None
 
     # the analytics module for portfolio performance analysis
     logger.info("Initializing analytics module...")
-    if config.trading_bot_config.test_mode:
-        analytics = PortfolioAnalytics(trades_csv_test, order_ids_csv_test, config, exchanges)
-    else:
-        analytics = PortfolioAnalytics(trades_csv, order_ids_csv, config, exchanges)
+    with timer.stage("analytics"):
+        if config.trading_bot_config.test_mode:
+            trades_file, order_ids_file = trades_csv_test, order_ids_csv_test
+        else:
+            trades_file, order_ids_file = trades_csv, order_ids_csv
+        analytics = PortfolioAnalytics(
+            trades_file, order_ids_file, config, exchanges, lazy=lazy_startup, snapshot_store=snapshot_store
+        )
 
     # the bot interacting with exchanges
     logger.info("Initializing trading bot...")
-    trading_bot = TradingBot(config, analytics, exchanges)
+    with timer.stage("trading bot"):
+        trading_bot = TradingBot(config, analytics, exchanges)
 
     # telegram bot interacting with the user
     if telegram_bot:
         logger.info("Initializing telegram bot...")
-        message_bot = TelegramBot(config, trading_bot)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        task = loop.create_task(message_bot.run_polling())
-        threading.Thread(target=loop.run_forever, daemon=True).start()
+        with timer.stage("telegram bot"):
+            from messages import TelegramBot
+
+            message_bot = TelegramBot(config, trading_bot)
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            task = loop.create_task(message_bot.run_polling())
+            threading.Thread(target=loop.run_forever, daemon=True).start()
     else:
         message_bot = None
 
     if message_bot is not None:
         logger.info("Initializing savings plan scheduler...")
+        from savings_plan_scheduler import SavingsPlanScheduler
+
         scheduler = SavingsPlanScheduler(config, message_bot)
         savings_plan = threading.Thread(target=scheduler.run, daemon=True)
         savings_plan.start()
@@ -76,13 +97,27 @@ if __name__ == "__main__":
 
     # dashboard as web application
     if config.dashboard_config.dashboard:
-        logger.info("Initializing dashboard...")
-        dashboard = Dashboard(config, analytics)
-        webapp = threading.Thread(target=dashboard.run_dashboard, daemon=True)
+
+        def run_webapp():
+            # the dashboard preloads its figures, so it needs the analytics data
+            while not analytics.wait_until_ready():
+                logger.error(f"Dashboard start delayed, no analytics data: {analytics.unavailable_reason()}")
+            logger.info("Initializing dashboard...")
+            from dashboard_app import Dashboard, run_dashboard_workers, session_secret_key
+
+            if dashboard_workers:
+                run_dashboard_workers(config)
+            else:
+                dashboard = Dashboard(config, analytics, session_secret_key(config))
+                dashboard.run_dashboard()
+
+        webapp = threading.Thread(target=run_webapp, daemon=True)
         webapp.start()
     else:
         webapp = None
 
+    timer.report()
+
     if webapp is not None:
         webapp.join()
     if savings_plan is not None:
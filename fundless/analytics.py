@@ -1,60 +1,126 @@
 import asyncio
 import math
+import re
 
 import pandas as pd
 from pathlib import Path
 import pytz
 import requests.exceptions
 from pycoingecko import CoinGeckoAPI
-from pydantic import validate_arguments
-from pydantic.types import constr, Optional
-import plotly.express as px
-from typing import Tuple, Union, List
+from pydantic.types import Optional
+from typing import Iterable, Tuple, Union, List
 import numpy as np
-from time import time, sleep
-from redo import retrying
+from time import time, sleep, perf_counter
 from threading import Lock
 from datetime import datetime, timedelta
-from threading import Thread
+from dataclasses import dataclass
+from threading import Thread, Event
 import logging
-from currency_converter import CurrencyConverter
 import ccxt
 
 from config import Config, WeightingEnum, ExchangeEnum
 from utils import print_crypto_amount
 from constants import FIAT_SYMBOLS, COIN_REBRANDING, COIN_SYNONYMS, STABLE_COINS
-from exchanges import Exchanges
+from exchanges import Exchanges, ReadOnlyExchanges
+from metrics import metrics, InstrumentedClient, record_success, record_failure
+from snapshot_store import SnapshotStore
+from computations import ComputePool, history_cutoff, value_history
+from trade_log import Trade, TradeLog
+from order_recovery import OrderRecovery
+from rate_limiter import RateLimitedClient, get_limiter, INTERACTIVE, DEFAULT, BACKGROUND
 
 logger = logging.getLogger(__name__)
 
 date_time_regex = "(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})"
+date_time_pattern = re.compile(date_time_regex)
 
 # TODO: Idea: translate exchange symbol names to coingecko symbol names to have one single source of truth (coingecko)
 # translate coingecko symbols to ccxt/binance symbols
 coingecko_symbol_dict = {"miota": "iota"}
+# the market data columns that are used, market caps are only used relative to each other
+MARKET_COLUMNS = {
+    "id": object,
+    "symbol": object,
+    "name": object,
+    "image": object,
+    "current_price": "float64",
+    "market_cap": "float32",
+}
+
+
+def compact_markets(markets: pd.DataFrame) -> pd.DataFrame:
+    # prunes the CoinGecko market data (ROI, ATH, supply, ...) to the used columns, pages can overlap by a coin
+    return markets.drop_duplicates("id").reindex(columns=list(MARKET_COLUMNS)).astype(MARKET_COLUMNS)
+
+READY_TIMEOUT = 120  # seconds, callers waiting for the initial data give up after this and report it unavailable
 
 title_size = 28
 text_size = 20
 min_font_size = 10
 
 
-class PortfolioAnalytics:
+@dataclass(frozen=True)
+class AnalyticsSnapshot:
+    """
+    Consistent view of the analytics data, published as a whole after every refresh that changed the data.
+    The data frames are shared between all readers and must not be modified.
+    """
+
+    version: int
+    base_cost_row: str  # column of the cost in the base currency, at the time of the snapshot
     trades_df: pd.DataFrame
+    daily_summary: pd.DataFrame
+    index_df: pd.DataFrame
+    history_df: Optional[pd.DataFrame]
+    markets: pd.DataFrame
+
+
+class PortfolioAnalytics:
+    trade_log: TradeLog = None  # all trades, columnar, trades_df is materialized from it
     trades_file: Path
+    daily_summary: pd.DataFrame = None  # amount, cost, fee and base cost of the trades per day and coin
+    positions: pd.DataFrame = None  # amount and base cost per (lower case) coin, including the cherry picked coins
+    daily_summary_file: Path
     order_ids: pd.DataFrame
     order_ids_file: Path
     index_df: pd.DataFrame = None
     history_df: pd.DataFrame = None
-    coingecko: CoinGeckoAPI
+    coingecko: CoinGeckoAPI  # rate limited, interactive priority unless requested otherwise with with_priority()
     markets: pd.DataFrame  # CoinGecko Market Data
     top_non_stablecoins: pd.DataFrame
     running_updates = False
 
     last_market_update: float = 0  # seconds since epoch
+    last_full_market_update: float = 0  # last update of the whole coin universe, rather than the tracked coins
+    last_price_update: float = 0  # last price only update of the tracked coins
     last_history_update_month: float = 0  # seconds since epoch
     last_history_update_day: float = 0
     history_update_lock = Lock()
     last_trades_update: float = 0
+    trades_file_mtime: int = None  # mtime of the trades file, when it was last read or written by us
+    snapshot: AnalyticsSnapshot = None  # latest published data, readers should use this rather than the attributes
+    data_version: int = 0  # increased whenever the data shown in the dashboard changes
+    _data_fingerprint: int = None
+    _memory_metrics_version: int = None  # data version of the last memory gauge update
+    last_update_error: Optional[str] = None  # error of the last failed update, reported while no data is available
+    snapshot_store: SnapshotStore = None  # shares the published data with dashboard worker processes
+    read_only = False  # dashboard worker instance, following the data of the bot process without API access
+    # attributes, that are shared with dashboard worker processes in addition to the snapshot
+    shared_attributes = (
+        "top_non_stablecoins",
+        "exchange_balance",
+        "last_market_update",
+        "top_symbols",
+        "top_performances",
+        "top_growth",
+        "worst_symbols",
+        "worst_performances",
+        "worst_growth",
+    )
+    cross_rate_ttl: float = 60  # seconds, cross rates are derived from the market data or fetched from CoinGecko
+    compute_pool: ComputePool  # runs CPU heavy pandas computations for the dashboard
+    _currency_converter = None
+    currency_converter_lock = Lock()
 
     def __init__(
         self,
@@ -62,25 +128,120 @@ class PortfolioAnalytics:
         order_ids_file: Union[str, Path],
         config: Config,
         exchanges: Exchanges,
+        lazy: bool = False,
+        snapshot_store: SnapshotStore = None,
     ):
+        self.init_time = perf_counter()
+        self.ready = Event()  # set, as soon as the initial data is loaded
         self.config = config
         self.init_config_parameters()
         self.trades_file = Path(trades_file)
+        self.daily_summary_file = self.trades_file.with_name(f"{self.trades_file.stem}_daily.csv")
         self.order_ids_file = Path(order_ids_file)
-        self.coingecko = CoinGeckoAPI()
+        self.coingecko = self.coingecko_client(config)
         self.exchanges = exchanges
         self.exchange_balance = None
+        self.snapshot_store = snapshot_store
+        self.compute_pool = ComputePool(processes=config.dashboard_config.compute_processes)
+        self.cross_rates = {}  # (crypto, vs_currency) -> (price, time of computation)
+        self.order_recovery = OrderRecovery(
+            lambda: self.exchanges.active, lambda: self.config.trading_bot_config.exchange
+        )
 
         if not self.trades_file.exists():
             self.trades_df = pd.DataFrame(columns=self.trades_cols)
             self.trades_df.to_csv(self.trades_file, index=False)
+            self.trades_file_mtime = self.trades_file.stat().st_mtime_ns
+            self.daily_summary = self.load_daily_summary(self.trades_df)
+            self.positions = self.compute_positions(self.daily_summary)
             self.last_trades_update = time()
         if not self.order_ids_file.exists():
             self.order_ids = pd.DataFrame(columns=["id", "symbol", "date"])
             self.order_ids.to_csv(self.order_ids_file, index=False)
-        asyncio.run(self.update_data())  # Make sure all data is fetched initially
+        if not lazy:
+            asyncio.run(self.update_data())  # Make sure all data is fetched initially
+        # in lazy mode the initial data is fetched by the background updates, use wait_until_ready() before access
         self.run_api_updates()
-        self.currency_converter = CurrencyConverter()
+
+    @classmethod
+    def from_snapshot_store(
+        cls, config: Config, exchanges: Union[Exchanges, ReadOnlyExchanges], snapshot_store: SnapshotStore
+    ):
+        """
+        Read only instance for dashboard worker processes. Instead of fetching data from the APIs, it follows the
+        analytics state published by the bot process.
+        """
+        self = cls.__new__(cls)
+        self.read_only = True
+        self.init_time = perf_counter()
+        self.ready = Event()
+        self.config = config
+        self.init_config_parameters()
+        self.coingecko = self.coingecko_client(config)
+        self.exchanges = exchanges
+        self.exchange_balance = None
+        self.snapshot_store = snapshot_store
+        self.compute_pool = ComputePool(processes=config.dashboard_config.compute_processes)
+        self.run_snapshot_updates()
+        return self
+
+    def run_snapshot_updates(self):
+        def follow_snapshots():
+            state = None
+            while True:
+                latest = self.snapshot_store.read()
+                if latest is not None and latest is not state:
+                    state = latest
+                    self.load_shared_state(state)
+                sleep(1)
+
+        updates = Thread(target=follow_snapshots, daemon=True)
+        updates.start()
+
+    def shared_state(self) -> dict:
+        return {"snapshot": self.snapshot, **{name: getattr(self, name, None) for name in self.shared_attributes}}
+
+    def load_shared_state(self, state: dict):
+        for name in self.shared_attributes:
+            setattr(self, name, state[name])
+        snapshot = state["snapshot"]
+        self.trades_df = snapshot.trades_df
+        self.daily_summary = snapshot.daily_summary
+        self.index_df = snapshot.index_df
+        self.history_df = snapshot.history_df
+        self.markets = snapshot.markets
+        self.symbol_prices = snapshot.markets.set_index("symbol")["current_price"]
+        self.snapshot = snapshot
+        self.data_version = snapshot.version
+        if not self.ready.is_set():
+            logger.info(f"Initial analytics state loaded after {perf_counter() - self.init_time:.1f} seconds")
+            self.ready.set()
+
+    @property
+    def trades_df(self) -> Optional[pd.DataFrame]:
+        # materialized from the trade log on every access, the published frame is `snapshot.trades_df`
+        return None if self.trade_log is None else self.trade_log.to_frame()
+
+    @trades_df.setter
+    def trades_df(self, trades_df: Optional[pd.DataFrame]):
+        self.trade_log = None if trades_df is None else TradeLog.from_frame(trades_df)
+
+    @property
+    def currency_converter(self):
+        # loading the ECB dataset takes a while, so it is only done on first use
+        with self.currency_converter_lock:
+            if self._currency_converter is None:
+                from currency_converter import CurrencyConverter
+
+                self._currency_converter = CurrencyConverter()
+        return self._currency_converter
+
+    def wait_until_ready(self, timeout: Optional[float] = READY_TIMEOUT) -> bool:
+        # False, if the initial data could not be loaded in time, see last_update_error for the reason
+        return self.ready.wait(timeout)
+
+    def unavailable_reason(self) -> str:
+        return self.last_update_error or "the initial data is still loading"
 
     def run_api_updates(self):
         def run_updates():
@@ -92,15 +253,17 @@ class PortfolioAnalytics:
         updates.start()
 
     async def update_data(self):
+        start = perf_counter()
         try:
             await asyncio.gather(
-                self.update_markets(),
-                self.update_order_ids(),
-                self.update_trades_df(),
-                self.update_index_df(),
-                self.update_portfolio_metrics(),
-                self.update_historical_prices(),
-                self.update_exchange_balance(),
+                self.instrumented(self.update_markets()),
+                self.instrumented(self.update_prices()),
+                self.instrumented(self.update_order_ids()),
+                self.instrumented(self.update_trades_df()),
+                self.instrumented(self.update_index_df()),
+                self.instrumented(self.update_portfolio_metrics()),
+                self.instrumented(self.update_historical_prices()),
+                self.instrumented(self.update_exchange_balance()),
             )
         except (
             requests.exceptions.RequestException,
@@ -109,9 +272,68 @@ class PortfolioAnalytics:
         ) as e:
             logger.warning("Network error while fetching data from an API:")
             logger.warning(e)
+            self.last_update_error = f"network error: {e}"
         except Exception as e:
-            logger.error("Uncaught exception while updating analytics data!")
-            logger.error(e)
+            logger.exception("Uncaught exception while updating analytics data!")
+            self.last_update_error = f"{type(e).__name__}: {e}"
+        else:
+            self.last_update_error = None
+        finally:
+            metrics.observe("analytics_update_duration_seconds", perf_counter() - start)
+        # the data of the successful stages is published even if another stage failed
+        try:
+            if self.index_df is not None:
+                self.publish_snapshot()
+        except Exception:
+            logger.exception("Could not publish the analytics snapshot!")
+
+    def publish_snapshot(self):
+        # cheap content hash of the displayed data, so that readers are only notified about actual changes
+        frames = (self.index_df, self.daily_summary, self.history_df)
+        fingerprint = hash(
+            tuple(int(pd.util.hash_pandas_object(df).sum()) if df is not None else 0 for df in frames)
+        )
+        if fingerprint == self._data_fingerprint:
+            return
+        self._data_fingerprint = fingerprint
+        # a single attribute assignment, so readers either see the old or the new snapshot as a whole
+        self.snapshot = AnalyticsSnapshot(
+            version=self.data_version + 1,
+            base_cost_row=self.base_cost_row,
+            trades_df=self.trades_df,
+            daily_summary=self.daily_summary,
+            index_df=self.index_df,
+            history_df=self.history_df,
+            markets=self.markets,
+        )
+        self.data_version = self.snapshot.version
+        if self.snapshot_store is not None:
+            self.snapshot_store.write(self.shared_state())
+        if not self.ready.is_set():
+            logger.info(f"Initial analytics data loaded after {perf_counter() - self.init_time:.1f} seconds")
+            logger.info(f"Memory used by the analytics data:\n{self.memory_report()}")
+            self.ready.set()
+
+    @staticmethod
+    async def instrumented(coroutine):
+        # record duration, success/failure and time of last success of an update stage
+        stage = coroutine.__name__
+        start = perf_counter()
+        try:
+            await coroutine
+        except Exception:
+            record_failure(stage, perf_counter() - start)
+            logger.error(f"Update stage {stage} failed!")
+            raise
+        record_success(stage, perf_counter() - start)
+
+    @staticmethod
+    def coingecko_client(config: Config) -> RateLimitedClient:
+        # all CoinGecko requests of the process share one rate limit
+        calls_per_minute = config.trading_bot_config.coingecko_calls_per_minute
+        limiter = get_limiter("coingecko", rate=calls_per_minute / 60)
+        client = InstrumentedClient(CoinGeckoAPI(), provider="coingecko")
+        return RateLimitedClient(client, limiter, priority=INTERACTIVE)
 
     def init_config_parameters(self):
         self.base_cost_row = f"cost_{self.config.trading_bot_config.base_currency.value.lower()}"
@@ -149,8 +371,24 @@ class PortfolioAnalytics:
         if base_currency_changed:
             # update all market data again if base currency changed
             self.last_market_update = 0
+            self.last_full_market_update = 0
+            self.last_price_update = 0
             self.last_history_update_day = 0
             self.last_history_update_month = 0
+            # the summary has the costs in the old base currency. It is rebuilt right away, as other threads
+            # add trades to it, and once more when the trades file is reloaded by the next update
+            self.last_trades_update = 0
+            if self.trade_log is not None:
+                trades_df = self.trades_df
+                if self.base_cost_row not in trades_df.columns:
+                    position = min(self.trades_cols.index(self.base_cost_row), len(trades_df.columns))
+                    trades_df.insert(loc=position, column=self.base_cost_row, value=np.nan)
+                    self.trades_df = trades_df
+                self.daily_summary = self.compute_daily_summary(trades_df)
+                self.update_trades_file()
+                self.trades_file_mtime = None
+        if (base_currency_changed or index_changed) and self.daily_summary is not None:
+            self.positions = self.compute_positions(self.daily_summary)
         if index_changed:
             asyncio.run(self.update_index_df())
 
@@ -169,8 +407,16 @@ class PortfolioAnalytics:
         ]
 
     def available_quote_currency(self, convert_to_accounting_currency=True, force_update=False) -> float:
+        if self.read_only:
+            # dashboard workers show the balance shared by the bot process
+            force_update = False
+            if self.exchange_balance is None:
+                return 0.0
         if self.exchange_balance is None or force_update:
+            metrics.inc("cache_misses_total", cache="exchange_balance")
             asyncio.run(self.update_exchange_balance())
+        else:
+            metrics.inc("cache_hits_total", cache="exchange_balance")
         if convert_to_accounting_currency:
             return self.exchange_balance["converted"].get(self.config.trading_bot_config.base_symbol.upper(), 0.0)
         else:
@@ -186,12 +432,11 @@ class PortfolioAnalytics:
         )
         symbols = np.fromiter([key for key in balances.keys() if balances[key] > 0.0], dtype="U10")
         amounts = np.fromiter([balances.get(symbol, 0.0) for symbol in symbols], dtype=float)
-        balance["amount"] = {symbol.upper(): amount for symbol, amount in zip(symbols, amounts)}
-        balances["converted"] = {
-            symbol.upper(): self.convert(amount, symbol, self.config.trading_bot_config.base_currency)
-            for symbol, amount in zip(symbols, amounts)
-        }
-        self.exchange_balance = balances
+        symbols = np.char.upper(symbols)
+        converted = self.convert_many(amounts, symbols, self.config.trading_bot_config.base_currency)
+        balance["amount"] = dict(zip(symbols, amounts))
+        balance["converted"] = dict(zip(symbols, converted))
+        self.exchange_balance = balance
 
     # for cryptos that might have rebranded and changed their ticker some time
     def get_alternative_crypto_symbols(self, symbol: str) -> [str]:
@@ -281,19 +526,112 @@ class PortfolioAnalytics:
             from_symbol_price = self.get_crypto_price(from_symbol, to_symbol)
             return amount * from_symbol_price
 
+    def conversion_rates(self, from_symbols, to_symbol: str) -> dict:
+        """
+        Conversion rates from each of the distinct `from_symbols` to `to_symbol`. Crypto prices are taken from the
+        market data if possible, all other crypto prices are fetched with a single CoinGecko request. The rate of
+        symbols without market data is NaN.
+        """
+        to_symbol = to_symbol.upper()
+        base_currency = self.config.trading_bot_config.base_currency.upper()
+        rates = {}
+        remote = {}  # crypto symbols and their coin id, that need a price in to_symbol from the api
+        unknown = []
+        for symbol in {str(symbol).upper() for symbol in from_symbols}:
+            try:
+                if symbol == to_symbol:
+                    rates[symbol] = 1.0
+                elif symbol in FIAT_SYMBOLS and to_symbol in FIAT_SYMBOLS:
+                    rates[symbol] = self.currency_converter.convert(1.0, symbol, to_symbol)
+                elif symbol in FIAT_SYMBOLS:
+                    rates[symbol] = 1 / self.get_crypto_price(to_symbol, symbol)
+                elif to_symbol == base_currency:
+                    rates[symbol] = self.get_crypto_price(symbol, to_symbol)
+                else:
+                    rate = self.cross_rate(symbol, to_symbol)
+                    if rate is None:
+                        remote[symbol] = self.get_coin_id(symbol)
+                    else:
+                        rates[symbol] = rate
+            except (IndexError, KeyError):
+                unknown.append(symbol)
+        if len(remote) > 0:
+            with metrics.retrying(
+                self.coingecko.get_price,
+                provider="coingecko",
+                endpoint="get_price",
+                sleeptime=1,
+                sleepscale=2,
+                jitter=0,
+                retry_exceptions=(requests.exceptions.HTTPError,),
+            ) as get_price:
+                prices = get_price(list(set(remote.values())), vs_currencies=to_symbol.lower())
+            for symbol, coin_id in remote.items():
+                price = prices.get(coin_id, {}).get(to_symbol.lower())
+                if price is None:
+                    unknown.append(symbol)
+                    continue
+                rates[symbol] = price
+                self.cross_rates[(symbol, to_symbol)] = (price, time())
+        if len(unknown) > 0:
+            logger.warning(f"No conversion rate from {', '.join(sorted(unknown))} to {to_symbol}")
+            rates.update({symbol: np.nan for symbol in unknown})
+        return rates
+
+    def convert_many(self, amounts, from_symbols, to_symbol: str) -> np.ndarray:
+        # vectorized version of convert, for arrays of amounts given in different currencies
+        from_symbols = pd.Series(np.asarray(from_symbols, dtype=str)).str.upper()
+        rates = from_symbols.map(self.conversion_rates(from_symbols.unique(), to_symbol)).to_numpy(dtype=float)
+        return np.nan_to_num(np.asarray(amounts, dtype=float) * rates)
+
+    def cross_rate(self, crypto: str, vs_currency: str) -> Optional[float]:
+        """
+        Price of a crypto in a currency other than the base currency, derived from the market data (prices in base
+        currency) as price(crypto) / price(vs_currency). Results are cached for `cross_rate_ttl` seconds.
+        None, if the rate is neither cached nor derivable.
+        """
+        key = (crypto.upper(), vs_currency.upper())
+        cached = self.cross_rates.get(key)
+        if cached is not None and cached[1] > time() - self.cross_rate_ttl:
+            metrics.inc("cache_hits_total", cache="cross_rates")
+            return cached[0]
+        metrics.inc("cache_misses_total", cache="cross_rates")
+
+        base_currency = self.config.trading_bot_config.base_currency.upper()
+        markets = self.symbol_prices
+        crypto_price = markets.get(crypto.lower())
+        if crypto_price is None or isinstance(crypto_price, pd.Series):
+            # unknown or ambiguous symbol
+            return None
+        if key[1] in FIAT_SYMBOLS and base_currency in FIAT_SYMBOLS:
+            rate = crypto_price * self.currency_converter.convert(1.0, base_currency, key[1])
+        elif key[1] not in FIAT_SYMBOLS and isinstance(markets.get(vs_currency.lower()), float):
+            if markets[vs_currency.lower()] <= 0:
+                return None
+            rate = crypto_price / markets[vs_currency.lower()]
+        else:
+            return None
+        self.cross_rates[key] = (rate, time())
+        return rate
+
     def get_crypto_price(self, crypto: str, vs_currency: str):
         crypto_id = self.get_coin_id(crypto)
         if vs_currency.lower() == self.config.trading_bot_config.base_currency.lower():
-            price = self.markets.loc[self.markets["id"] == crypto_id, ["current_price"]].values[0][0]
-        else:
-            with retrying(
+            return self.markets.loc[self.markets["id"] == crypto_id, ["current_price"]].values[0][0]
+        price = self.cross_rate(crypto, vs_currency)
+        if price is None:
+            # not derivable from the market data
+            with metrics.retrying(
                 self.coingecko.get_price,
+                provider="coingecko",
+                endpoint="get_price",
                 sleeptime=1,
                 sleepscale=2,
                 jitter=0,
                 retry_exceptions=(requests.exceptions.HTTPError,),
             ) as get_price:
                 price = get_price(crypto_id, vs_currencies=vs_currency.lower())[crypto_id][vs_currency.lower()]
+            self.cross_rates[(crypto.upper(), vs_currency.upper())] = (price, time())
         return price
 
     def base_symbol_to_base_currency(self, base_symbol_amount: float):
@@ -308,6 +646,15 @@ class PortfolioAnalytics:
 
     async def update_trades_df(self):
         if self.last_trades_update < time() - 60:
+            mtime = self.trades_file.stat().st_mtime_ns
+            if self.trade_log is not None and mtime == self.trades_file_mtime:
+                # the trade log is up to date, the file is only reloaded after external changes
+                recovered = self.check_missing_orders(set(self.trade_log.column("id").astype(str)))
+                if len(recovered) > 0:
+                    logger.info(f"Adding {len(recovered)} recovered orders to trades.csv")
+                    self.add_trades(recovered)
+                self.last_trades_update = time()
+                return
             trades_df = pd.read_csv(self.trades_file, dtype=self.csv_dtypes, parse_dates=["date"])
             trades_df.date = pd.to_datetime(trades_df.date, utc=True)
 
@@ -323,53 +670,11 @@ class PortfolioAnalytics:
                     trades_df.insert(loc=self.trades_cols.index(col), column=col, value=np.nan)
                     update_file = True
 
-            # check for missing orders (that are in order_ids.csv but not in trades.csv)
-            missing_ids = self.order_ids.loc[~self.order_ids["id"].isin(trades_df["id"])]
-            if len(missing_ids) > 0:
-                logger.warning("Found orders in orders.csv that are not in trades.csv!")
-                logger.warning("Adding them to trades.csv")
-                for id, symbol, date in zip(
-                    missing_ids["id"].values,
-                    missing_ids["symbol"].values,
-                    missing_ids["date"].values,
-                ):
-
-                    if (
-                        date.astype(np.int64)
-                        > (pd.Timestamp.now(tz="Europe/Berlin") - pd.Timedelta(minutes=10)).value
-                    ):
-                        logger.info(f"Skipping order {id}, as it will be added by the savings plan bot.")
-                        # skip orders, that are new, as they are still pending to be added regularly
-                        continue
-                    with retrying(
-                        self.exchanges.active.fetch_order,
-                        sleeptime=30,
-                        sleepscale=1,
-                        jitter=0,
-                        retry_exceptions=(ccxt.errors.BaseError,),
-                    ) as fetch_order:
-                        order = fetch_order(id, symbol)
-                        if order["status"] == "open":
-                            logger.info(f"Order {id} is not yet closed!")
-                            continue
-                        else:
-                            logger.info(f"Order {id} closed, adding to trades.csv")
-                            trades_df = self.add_trade(
-                                trades_df=trades_df,
-                                date=datetime.fromtimestamp(order["timestamp"] / 1000.0).strftime(
-                                    "%Y-%m-%d %H:%M:%S"
-                                ),
-                                id=str(id),
-                                buy_symbol=order["symbol"].split("/")[0],
-                                sell_symbol=order["symbol"].split("/")[1],
-                                price=order["price"],
-                                amount=order["amount"],
-                                cost=order["cost"],
-                                fee=order["fee"]["cost"] if order["fee"] is not None else 0.0,
-                                fee_symbol=order["fee"]["currency"] if order["fee"] is not None else "",
-                                exchange=self.config.trading_bot_config.exchange,
-                            )
-                            update_file = True
+            recovered = self.check_missing_orders(set(trades_df["id"].astype(str)))
+            if len(recovered) > 0:
+                logger.info(f"Adding {len(recovered)} recovered orders to trades.csv")
+                trades_df = self.add_trades(recovered, trades_df=trades_df)
+                update_file = True
 
             # compute total cost if missing
             trades_df["fee"].fillna(0.0, inplace=True)
@@ -389,7 +694,9 @@ class PortfolioAnalytics:
                     if row.sell_symbol.lower() != accounting_currency:
                         # TODO use convert method (implement historic prices in convert method)
                         return (
-                            self.coingecko.get_coin_history_by_id(coin_id, date=date, localization=False)[
+                            self.coingecko.with_priority(BACKGROUND).get_coin_history_by_id(
+                                coin_id, date=date, localization=False
+                            )[
                                 "market_data"
                             ]["current_price"][accounting_currency]
                             * row.cost_total
@@ -397,10 +704,12 @@ class PortfolioAnalytics:
                     else:
                         return row.cost_total
 
-                with retrying(
+                with metrics.retrying(
                     convert_cost,
-                    sleeptime=20,
-                    sleepscale=1,
+                    provider="coingecko",
+                    endpoint="get_coin_history_by_id",
+                    sleeptime=1,
+                    sleepscale=2,
                     jitter=0,
                     retry_exceptions=(requests.exceptions.HTTPError,),
                 ) as get_base_cost:
@@ -441,14 +750,54 @@ class PortfolioAnalytics:
                 update_file = True
 
             trades_df.date = pd.to_datetime(trades_df.date, utc=True)
+            self.daily_summary = self.load_daily_summary(trades_df)
+            self.positions = self.compute_positions(self.daily_summary)
             self.trades_df = trades_df
+            self.trades_file_mtime = mtime
             self.last_trades_update = time()
             if update_file:
                 self.update_trades_file()
 
+    def check_missing_orders(self, known_ids: set) -> List[dict]:
+        # check for missing orders (that are in order_ids.csv but not in trades.csv), returns the orders recovered
+        # in the background since the last check, so that they are ingested as one batch
+        missing_ids = self.order_ids.loc[~self.order_ids["id"].astype(str).isin(known_ids)]
+        # skip orders, that are new, as they are still pending to be added regularly
+        pending = missing_ids["date"] > pd.Timestamp.now(tz="UTC") - pd.Timedelta(minutes=10)
+        for id in missing_ids.loc[pending, "id"]:
+            logger.info(f"Skipping order {id}, as it will be added by the savings plan bot.")
+        missing_ids = missing_ids.loc[~pending]
+        # negative ids are the costs of dummy orders of the base symbol, there is nothing to fetch
+        missing_ids = missing_ids.loc[~(pd.to_numeric(missing_ids["id"], errors="coerce") < 0)]
+        recovered = [record for record in self.order_recovery.take() if record["id"] not in known_ids]
+        missing_ids = missing_ids.loc[~missing_ids["id"].astype(str).isin({record["id"] for record in recovered})]
+        if len(missing_ids) > 0:
+            logger.warning(f"Found {len(missing_ids)} orders in orders.csv that are not in trades.csv!")
+            self.order_recovery.start(missing_ids)
+        return recovered
+
     def update_trades_file(self):
-        self.trades_df.sort_values("date", inplace=True)
+        self.trade_log.sort_by_date()
         self.trades_df.to_csv(self.trades_file, index=False)
+        self.trades_file_mtime = self.trades_file.stat().st_mtime_ns
+        self.daily_summary.to_csv(self.daily_summary_file)
+
+    def append_to_trades_file(self, trades: List[Trade]):
+        # the trades file stays sorted by date, so older trades (e.g. recovered orders) need a rewrite
+        trades = sorted(trades, key=lambda trade: trade.date)
+        last_date = self.trade_log.last_date
+        in_order = last_date is None or trades[0].date >= last_date
+        for trade in trades:
+            self.trade_log.append(trade, self.base_cost_row)
+        if in_order:
+            new_trades = pd.DataFrame.from_records([trade.as_record(self.base_cost_row) for trade in trades])
+            new_trades = new_trades.reindex(columns=self.trade_log.columns)
+            new_trades["date"] = pd.to_datetime(new_trades["date"], utc=True)
+            new_trades.to_csv(self.trades_file, mode="a", header=False, index=False)
+        else:
+            self.trade_log.sort_by_date()
+            self.trades_df.to_csv(self.trades_file, index=False)
+        self.trades_file_mtime = self.trades_file.stat().st_mtime_ns
 
     def add_order_id(self, id: str, symbol: str, date: Union[str, datetime]):
         date = pd.to_datetime(date, infer_datetime_format=True)
@@ -473,65 +822,184 @@ class PortfolioAnalytics:
         self.order_ids.to_csv(self.order_ids_file, index=False)
 
     async def update_markets(self, force=False):
-        if not force:
-            # do not update, if last update 2 seconds ago
-            if self.last_market_update >= time() - 2:
-                return
+        trading_config = self.config.trading_bot_config
+        now = time()
+        full_update = (
+            force
+            or not trading_config.markets_tracked_only
+            or self.last_full_market_update < now - trading_config.markets_full_refresh_ttl
+        )
+        if not full_update and self.last_market_update >= now - trading_config.markets_ttl:
+            return
 
         # update market data from coingecko
+        vs_currency = trading_config.base_currency.value
         try:
-            with retrying(
-                self.coingecko.get_coins_markets,
-                sleeptime=20,
-                sleepscale=1,
+            with metrics.retrying(
+                self.coingecko.with_priority(DEFAULT).get_coins_markets,
+                provider="coingecko",
+                endpoint="get_coins_markets",
+                sleeptime=1,
+                sleepscale=2,
                 jitter=0,
                 retry_exceptions=(requests.exceptions.HTTPError,),
             ) as get_markets:
-                markets = pd.DataFrame.from_records(
-                    get_markets(
-                        vs_currency=self.config.trading_bot_config.base_currency.value,
-                        per_page=250,
+                if full_update:
+                    markets = pd.DataFrame.from_records(get_markets(vs_currency=vs_currency, per_page=250))
+                    more_markets = pd.DataFrame.from_records(
+                        get_markets(vs_currency=vs_currency, per_page=250, page=2)
                     )
-                )
-                more_markets = pd.DataFrame.from_records(
-                    get_markets(
-                        vs_currency=self.config.trading_bot_config.base_currency.value, per_page=250, page=2
+                    markets = pd.concat([markets, more_markets], ignore_index=True)
+                else:
+                    # only the coins we hold or index
+                    markets = pd.DataFrame.from_records(
+                        get_markets(vs_currency=vs_currency, ids=self.tracked_coin_ids(), per_page=250)
                     )
-                )
-                markets = pd.concat([markets, more_markets], ignore_index=True)
                 markets["symbol"] = markets["symbol"].str.lower()
         except requests.exceptions.HTTPError as e:
             logger.error("Network error while updating market data from CoinGecko:")
             logger.error(e)
             return
-        markets.replace(coingecko_symbol_dict, inplace=True)
-        self.markets = markets
-        self.top_non_stablecoins = markets.loc[~markets.symbol.str.upper().isin(STABLE_COINS)]
+        markets = compact_markets(markets)
+        markets["symbol"] = markets["symbol"].replace(coingecko_symbol_dict)
+        markets, moved = self.merge_markets(markets, replace=full_update)
+        metrics.inc("market_prices_moved_total", len(moved))
+        self.apply_markets(markets, moved)
         self.last_market_update = time()
+        self.last_price_update = self.last_market_update
+        if full_update:
+            self.last_full_market_update = self.last_market_update
+
+    async def update_prices(self):
+        # fast path between market updates: current prices (and market caps) of the tracked coins only
+        trading_config = self.config.trading_bot_config
+        if getattr(self, "markets", None) is None or self.last_price_update >= time() - trading_config.prices_ttl:
+            return
+        vs_currency = trading_config.base_currency.value.lower()
+        coin_ids = self.tracked_coin_ids()
+        if len(coin_ids) == 0:
+            return
+        with metrics.retrying(
+            self.coingecko.with_priority(DEFAULT).get_price,
+            provider="coingecko",
+            endpoint="get_price",
+            sleeptime=1,
+            sleepscale=2,
+            jitter=0,
+            retry_exceptions=(requests.exceptions.HTTPError,),
+        ) as get_price:
+            prices = get_price(coin_ids, vs_currencies=vs_currency, include_market_cap=True)
+        if len(prices) == 0:
+            return
+        fetched = pd.DataFrame.from_dict(prices, orient="index").rename(
+            columns={vs_currency: "current_price", f"{vs_currency}_market_cap": "market_cap"}
+        )
+        fetched = fetched.rename_axis("id").reset_index()
+        fetched = fetched.merge(self.markets[["id", "symbol"]], on="id").astype({"market_cap": "float32"})
+        markets, moved = self.merge_markets(fetched)
+        metrics.inc("market_prices_moved_total", len(moved))
+        self.apply_markets(markets, moved)
+        self.last_price_update = time()
+
+    def apply_markets(self, markets: pd.DataFrame, moved: set):
+        if len(moved) > 0:
+            # cross rates of coins, whose price did not move, stay valid
+            self.cross_rates = {
+                key: value
+                for key, value in self.cross_rates.items()
+                if key[0] not in moved and key[1] not in moved
+            }
+        if markets is not getattr(self, "markets", None):
+            self.markets = markets
+            self.symbol_prices = markets.set_index("symbol")["current_price"]
+            self.top_non_stablecoins = markets.loc[~markets.symbol.str.upper().isin(STABLE_COINS)]
+
+    def tracked_coin_ids(self) -> List[str]:
+        # coins we hold or that are part of the index, plus the base symbol
+        symbols = {self.config.trading_bot_config.base_symbol.lower()}
+        symbols.update(self.config.trading_bot_config.cherry_pick_symbols or [])
+        if self.trade_log is not None:
+            symbols.update(self.trade_log.column("buy_symbol").str.lower().unique())
+        if self.index_df is not None:
+            symbols.update(self.index_df["symbol"].str.lower())
+        return self.markets.loc[self.markets["symbol"].isin(symbols), "id"].tolist()
+
+    def merge_markets(self, fetched: pd.DataFrame, replace: bool = False) -> Tuple[pd.DataFrame, set]:
+        """
+        Diffs the fetched market data against the current one. Returns the new market data and the (upper case)
+        symbols, whose price moved. If no price moved in a partial update, the current market data object is
+        returned, so that nothing depending on it is invalidated.
+        """
+        markets = getattr(self, "markets", None)
+        if markets is None:
+            return fetched, set(fetched["symbol"].str.upper())
+        old_prices = markets.set_index("id")["current_price"]
+        new_prices = fetched.set_index("id")["current_price"]
+        old_prices = old_prices.reindex(new_prices.index)
+        changed = new_prices.ne(old_prices) & ~(new_prices.isna() & old_prices.isna())
+        changed_ids = new_prices.index[changed.to_numpy()]
+        moved = set(fetched.loc[fetched["id"].isin(changed_ids), "symbol"].str.upper())
+        if replace:
+            return fetched, moved
+        if len(changed_ids) == 0:
+            return markets, moved
+        # copy, as the current market data is part of the published snapshot
+        markets = markets.set_index("id")
+        updates = fetched.set_index("id").loc[changed_ids]
+        known = updates.index.isin(markets.index)
+        # a price only update just replaces the fetched columns
+        columns = markets.columns.intersection(updates.columns)
+        markets.loc[updates.index[known], columns] = updates.loc[known, columns]
+        markets = pd.concat([markets, updates.loc[~known].reindex(columns=markets.columns)])
+        return markets.reset_index(), moved
 
     async def update_index_df(self):
-        # update index portfolio value
-        other = pd.DataFrame(index=self.config.trading_bot_config.cherry_pick_symbols)
-        index_df = (
-            self.trades_df[["buy_symbol", "amount", self.base_cost_row]]
-            .copy()
-            .groupby("buy_symbol")
-            .sum(numeric_only=True)
+        # update index portfolio value, the positions are aligned with the market data by symbol
+        markets = self.markets.drop_duplicates("symbol")  # ambiguous symbols: the coin with the largest market cap
+        positions = self.positions
+        rows = pd.Index(markets["symbol"]).get_indexer(positions.index)
+        known = rows >= 0
+        order = np.argsort(rows[known], kind="stable")  # keep the market cap order of the market data
+        rows = rows[known][order]
+        amount = positions["amount"].to_numpy()[known][order]
+        base_cost = positions[self.base_cost_row].to_numpy()[known][order]
+        current_price = markets["current_price"].to_numpy(dtype=float)[rows]
+        value = current_price * amount
+        with np.errstate(divide="ignore", invalid="ignore"):
+            allocation = value / value.sum()
+            performance = value / base_cost - 1
+        self.index_df = pd.DataFrame(
+            {
+                "symbol": markets["symbol"].str.upper().to_numpy()[rows],
+                "current_price": current_price,
+                "amount": amount,
+                self.base_cost_row: base_cost,
+                "value": value,
+                "allocation": allocation,
+                "performance": performance,
+            },
+            index=markets.index[rows],
         )
-        index_df.index = index_df.index.str.lower()
-        index_df = pd.merge(index_df, other, how="outer", left_index=True, right_index=True)
-        index_df.fillna(value=0, inplace=True, axis="columns")
-        index_df = self.markets[["symbol", "current_price"]].join(index_df, on="symbol", how="inner")
-        index_df["value"] = index_df["current_price"] * index_df["amount"]
-        index_df["allocation"] = index_df["value"] / index_df["value"].sum()
-        index_df["symbol"] = index_df["symbol"].str.upper()
-        index_df["performance"] = index_df["value"] / index_df[self.base_cost_row] - 1
-        self.index_df = index_df
-
-    @validate_arguments
+
+    def compute_positions(self, daily_summary: pd.DataFrame) -> pd.DataFrame:
+        positions = daily_summary.groupby(level="buy_symbol", observed=True)[["amount", self.base_cost_row]].sum()
+        positions.index = positions.index.str.lower()
+        positions = positions.groupby(level=0, observed=True).sum()
+        cherry_picked = pd.Index(self.config.trading_bot_config.cherry_pick_symbols or [])
+        return positions.reindex(positions.index.union(cherry_picked), fill_value=0.0)
+
+    def add_to_position(self, buy_symbol: str, amount: float, base_cost: float):
+        # replaced rather than modified, like the daily summary
+        positions = self.positions.copy()
+        symbol = buy_symbol.lower()
+        if symbol not in positions.index:
+            positions.loc[symbol] = 0.0
+        positions.loc[symbol, ["amount", self.base_cost_row]] += [amount, base_cost]
+        self.positions = positions
+
     def add_trade(
         self,
-        date: Union[constr(regex=date_time_regex), datetime],
+        date: Union[str, datetime],
         id: str,
         buy_symbol: str,
         sell_symbol: str,
@@ -544,46 +1012,219 @@ class PortfolioAnalytics:
         exchange: Optional[ExchangeEnum] = None,
         trades_df=None,
     ):
-        if base_cost is None:
-            base_cost = self.base_symbol_to_base_currency(cost)
-        if fee is None:
-            fee = 0
-        if fee_symbol is None:
-            fee_symbol = ""
-        if exchange is None:
-            exchange = self.config.trading_bot_config.exchange
-        date = pd.to_datetime(date, infer_datetime_format=True)
-        if date.tzinfo is None:
-            date = date.tz_localize("Europe/Berlin")
-        else:
-            date = date.tz_convert("Europe/Berlin")
+        # raises a ValueError for an invalid trade, rather than skipping it like the batches
+        record = dict(
+            date=date,
+            id=id,
+            buy_symbol=buy_symbol,
+            sell_symbol=sell_symbol,
+            price=price,
+            amount=amount,
+            cost=cost,
+            fee=fee,
+            fee_symbol=fee_symbol,
+            base_cost=base_cost,
+            exchange=exchange,
+        )
+        return self.add_trades([record], trades_df=trades_df, strict=True)
+
+    def validate_trades(self, records: List[dict], strict: bool = False) -> List[Trade]:
+        """
+        Validates and normalizes a batch of trade records (keyword arguments of add_trade) column by column.
+        Dates are strings starting with "YYYY-mm-dd HH:MM:SS" (Europe/Berlin) or datetimes, a missing base cost is
+        converted from the cost in base symbol. Invalid records are logged and left out, with `strict` they raise a
+        ValueError instead.
+        """
+        fields = ["date", "id", "buy_symbol", "sell_symbol", "price", "amount", "cost"]
+        fields += ["fee", "fee_symbol", "base_cost", "exchange"]
+        columns = {field: np.array([record.get(field) for record in records], dtype=object) for field in fields}
+        missing = {field: pd.isna(values) for field, values in columns.items()}
+
+        dates = columns["date"]
+        is_string = np.array([isinstance(date, str) for date in dates], dtype=bool)
+        invalid = ~is_string & ~np.array([isinstance(date, datetime) for date in dates], dtype=bool)
+        invalid[is_string] = [date_time_pattern.match(date) is None for date in dates[is_string]]
+        parsed = np.empty(len(records), dtype=object)
+        if is_string.any():
+            strings = pd.to_datetime(pd.Series(dates[is_string], dtype=str), errors="coerce")
+            invalid[is_string] |= strings.isna().to_numpy()
+            parsed[is_string] = list(strings.dt.tz_localize("Europe/Berlin"))
+        for i in np.flatnonzero(~is_string & ~invalid):
+            date = pd.Timestamp(dates[i])
+            parsed[i] = (
+                date.tz_localize("Europe/Berlin") if date.tzinfo is None else date.tz_convert("Europe/Berlin")
+            )
+        numbers = {}
+        for field in ["price", "amount", "cost", "fee", "base_cost"]:
+            numbers[field] = pd.to_numeric(columns[field], errors="coerce").astype(float)
+            # missing values are only allowed for the optional fields
+            invalid |= np.isnan(numbers[field]) & (~missing[field] if field in ("fee", "base_cost") else True)
+        for field in ["id", "buy_symbol", "sell_symbol"]:
+            invalid |= missing[field] | np.array([len(str(value)) == 0 for value in columns[field]], dtype=bool)
+        default_exchange = self.config.trading_bot_config.exchange
+        exchanges = np.empty(len(records), dtype=object)
+        for i, (exchange, is_missing) in enumerate(zip(columns["exchange"], missing["exchange"])):
+            try:
+                exchanges[i] = ExchangeEnum(default_exchange if is_missing else exchange).value
+            except ValueError:
+                invalid[i] = True
+        if invalid.any():
+            rejected = [record for record, is_invalid in zip(records, invalid) if is_invalid]
+            if strict:
+                raise ValueError(f"Invalid trades: {rejected}")
+            logger.error(f"Rejected {len(rejected)} invalid trades: {rejected}")
+        fees = np.nan_to_num(numbers["fee"])
+        fee_symbols = [
+            "" if is_missing else symbol
+            for symbol, is_missing in zip(columns["fee_symbol"], missing["fee_symbol"])
+        ]
+        base_costs = numbers["base_cost"]
+        if np.isnan(base_costs).any():
+            base_costs = np.where(
+                np.isnan(base_costs), numbers["cost"] * self.base_symbol_to_base_currency(1.0), base_costs
+            )
+        return [
+            Trade(
+                date=parsed[i],
+                id=str(columns["id"][i]),
+                buy_symbol=str(columns["buy_symbol"][i]).upper(),
+                sell_symbol=str(columns["sell_symbol"][i]).upper(),
+                price=numbers["price"][i],
+                amount=numbers["amount"][i],
+                cost=numbers["cost"][i],
+                fee=fees[i],
+                fee_symbol=str(fee_symbols[i]).upper(),
+                base_cost=base_costs[i],
+                exchange=exchanges[i],
+            )
+            for i in np.flatnonzero(~invalid)
+        ]
 
-        trade_dict = {
-            "date": [date],
-            "id": [id],
-            "buy_symbol": [buy_symbol.upper()],
-            "sell_symbol": [sell_symbol.upper()],
-            "price": [price],
-            "amount": [amount],
-            "cost": [cost],
-            "fee": [fee],
-            "fee_symbol": [fee_symbol.upper()],
-            self.base_cost_row: [base_cost],
-            "exchange": exchange.value,
-        }
-        trade_dict_df = pd.DataFrame.from_dict(trade_dict)
-        if trades_df is not None:
-            trades_df = pd.concat([trades_df, trade_dict_df], ignore_index=True)
+    def add_trades(self, records: Iterable[dict], trades_df: pd.DataFrame = None, strict: bool = False):
+        """
+        Adds a batch of trades (keyword arguments of add_trade), invalid trades are logged and skipped. With
+        `strict` they raise a ValueError and none of the trades is added. With `trades_df` the trades are
+        appended to that frame and it is returned, otherwise they are added to the trade log and the trades file.
+        """
+        trades = self.validate_trades(list(records), strict=strict)
+        if len(trades) == 0:
             return trades_df
+        if trades_df is not None:
+            new_trades = pd.DataFrame.from_records([trade.as_record(self.base_cost_row) for trade in trades])
+            return pd.concat([trades_df, new_trades], ignore_index=True)
+        self.append_to_trades_file(trades)
+        if len(trades) == 1:
+            trade = trades[0]
+            self.add_to_daily_summary(
+                trade.date, trade.buy_symbol, trade.amount, trade.cost, trade.fee, trade.base_cost
+            )
+            self.add_to_position(trade.buy_symbol, trade.amount, trade.base_cost)
+        else:
+            # the whole history is rebuilt once, rather than updated trade by trade
+            self.daily_summary = self.compute_daily_summary(self.trades_df)
+            self.positions = self.compute_positions(self.daily_summary)
+        # written after the trades, see load_daily_summary
+        self.daily_summary.to_csv(self.daily_summary_file)
+
+    def compute_daily_summary(self, trades_df: pd.DataFrame) -> pd.DataFrame:
+        dates = pd.to_datetime(trades_df["date"], utc=True)
+        grouped = trades_df.assign(date=dates).groupby(
+            [dates.dt.floor("d").rename("day"), "buy_symbol"], observed=True
+        )
+        summary = grouped[["amount", "cost", "fee", self.base_cost_row]].sum()
+        summary["trades"] = grouped.size()
+        summary["last_trade"] = grouped["date"].max()
+        # plain strings and sorted like the persisted summary, so that trades of new coins can be added
+        days, symbols = summary.index.get_level_values("day"), summary.index.get_level_values("buy_symbol")
+        summary.index = pd.MultiIndex.from_arrays([days, symbols.astype(str)], names=["day", "buy_symbol"])
+        return summary.sort_index()
+
+    def load_daily_summary(self, trades_df: pd.DataFrame) -> pd.DataFrame:
+        # use the persisted summary if it matches the trades file, otherwise rebuild it from the trades. The
+        # summary is always written after the trades, an older summary means the trades file was changed externally
+        if (
+            self.daily_summary_file.exists()
+            and self.daily_summary_file.stat().st_mtime_ns >= self.trades_file.stat().st_mtime_ns
+        ):
+            summary = pd.read_csv(
+                self.daily_summary_file,
+                index_col=["day", "buy_symbol"],
+                parse_dates=["day", "last_trade"],
+            )
+            if (
+                self.base_cost_row in summary.columns
+                and summary["trades"].sum() == len(trades_df)
+                and np.isclose(summary[self.base_cost_row].sum(), trades_df[self.base_cost_row].sum())
+            ):
+                return summary
+        summary = self.compute_daily_summary(trades_df)
+        summary.to_csv(self.daily_summary_file)
+        return summary
+
+    def add_to_daily_summary(
+        self, date: pd.Timestamp, buy_symbol: str, amount: float, cost: float, fee: float, base_cost: float
+    ):
+        # the summary is replaced rather than modified, so readers never see a partially updated table
+        date = date.tz_convert("UTC")
+        key = (date.floor("d"), buy_symbol)
+        summary = self.daily_summary.copy()
+        if key in summary.index:
+            for column, value in zip(
+                ["amount", "cost", "fee", self.base_cost_row], [amount, cost, fee, base_cost]
+            ):
+                summary.loc[key, column] += value
+            summary.loc[key, "trades"] += 1
+            summary.loc[key, "last_trade"] = max(summary.loc[key, "last_trade"], date)
         else:
-            self.trades_df = pd.concat([self.trades_df, trade_dict_df], ignore_index=True)
-            self.update_trades_file()
+            row = pd.DataFrame(
+                {
+                    "amount": [amount],
+                    "cost": [cost],
+                    "fee": [fee],
+                    self.base_cost_row: [base_cost],
+                    "trades": [1],
+                    "last_trade": [date],
+                },
+                index=pd.MultiIndex.from_tuples([key], names=["day", "buy_symbol"]),
+            )
+            summary = pd.concat([summary, row]).sort_index()
+        self.daily_summary = summary
+
+    def memory_usage(self) -> dict:
+        # memory used by the data heavy dataframes in bytes
+        frames = {
+            "trades_df": None if self.snapshot is None else self.snapshot.trades_df,
+            "daily_summary": self.daily_summary,
+            "positions": self.positions,
+            "index_df": self.index_df,
+            "history_df": self.history_df,
+            "markets": getattr(self, "markets", None),
+        }
+        usage = {name: int(df.memory_usage(deep=True).sum()) for name, df in frames.items() if df is not None}
+        if self.trade_log is not None:
+            usage["trade_log"] = self.trade_log.nbytes
+        return usage
+
+    def update_memory_metrics(self):
+        # called on scrape, the memory gauges only change with the data, so they are measured once per version
+        if self._memory_metrics_version == self.data_version:
+            return
+        self._memory_metrics_version = self.data_version
+        for frame, size in self.memory_usage().items():
+            metrics.set("analytics_frame_memory_bytes", size, frame=frame)
+
+    def memory_report(self) -> str:
+        usage = self.memory_usage()
+        ordered = sorted(usage.items(), key=lambda item: -item[1])
+        lines = [f"{name:<16}{size / 1024:>12,.1f} KiB" for name, size in ordered]
+        lines.append(f"{'total':<16}{sum(usage.values()) / 1024:>12,.1f} KiB")
+        return "\n".join(lines)
 
     async def index_balance(self) -> Tuple:
         await self.update_markets()
-        if self.index_df is None:
+        if self.snapshot is None:
             return None, None, None, None
-        index = self.index_df.sort_values(by="allocation", ascending=False)
+        index = self.snapshot.index_df.sort_values(by="allocation", ascending=False)
         allocations = index["allocation"].values * 100
         symbols = index["symbol"].values
         values = index["value"].values
@@ -592,51 +1233,55 @@ class PortfolioAnalytics:
 
     @property
     def performance(self) -> float:
-        if self.trades_df is None or self.index_df is None:
+        snapshot = self.snapshot
+        if snapshot is None:
             return 0
-        amount_invested = self.trades_df[self.base_cost_row].sum()
-        portfolio_value = self.index_df.value.sum()
+        amount_invested = snapshot.trades_df[snapshot.base_cost_row].sum()
+        portfolio_value = snapshot.index_df.value.sum()
         return portfolio_value / amount_invested - 1
 
     @property
     def invested(self) -> float:
-        if self.trades_df is None:
+        snapshot = self.snapshot
+        if snapshot is None:
             return 0
-        return self.trades_df[self.base_cost_row].sum()
+        return snapshot.trades_df[snapshot.base_cost_row].sum()
 
     @property
     def net_worth(self) -> float:
-        if self.index_df is None:
+        if self.snapshot is None:
             return 0
-        return self.index_df.value.sum()
+        return self.snapshot.index_df.value.sum()
 
     @property
     def pretty_index_df(self):
         df = pd.DataFrame()
-        if self.index_df is None:
+        if self.snapshot is None:
             return df
-        self.index_df.sort_values(by="allocation", ascending=False, inplace=True)
+        index_df = self.snapshot.index_df.sort_values(by="allocation", ascending=False)
         value_format = f"{self.config.trading_bot_config.base_currency.values[1]} {{:,.2f}}"
-        df["Coin"] = self.index_df["symbol"]
-        df["Currently in Index"] = self.index_df["symbol"].map(
+        df["Coin"] = index_df["symbol"]
+        df["Currently in Index"] = index_df["symbol"].map(
             lambda sym: "yes" if sym.lower() in self.config.trading_bot_config.cherry_pick_symbols else "no"
         )
-        df[f"Available"] = self.index_df["symbol"].map(
+        df[f"Available"] = index_df["symbol"].map(
             lambda sym: "yes" if self.coin_available_on_exchange(sym) else "no"
         )
-        df["Amount"] = self.index_df["amount"].map(print_crypto_amount)
-        df["Allocation"] = self.index_df["allocation"].map("{:.2%}".format)
+        df["Amount"] = index_df["amount"].map(print_crypto_amount)
+        df["Allocation"] = index_df["allocation"].map("{:.2%}".format)
         _, target_allocation = self.fetch_index_weights(symbols=df["Coin"])
         df["Target Allocation"] = target_allocation
         df["Target Allocation"] = df["Target Allocation"].map(lambda row: f"{row:.2%}" if row != 0 else "-")
-        df["Value"] = self.index_df["value"].map(value_format.format)
-        df["Performance"] = self.index_df["performance"].fillna(0).map("{:.2%}".format)
+        df["Value"] = index_df["value"].map(value_format.format)
+        df["Performance"] = index_df["performance"].fillna(0).map("{:.2%}".format)
         return df
 
     def allocation_pie(self, as_image=False, title=True):
-        if self.index_df is None:
+        import plotly.express as px  # imported on first use, as it is slow to import
+
+        if self.snapshot is None:
             return {}
-        allocation_df = self.index_df.copy()
+        allocation_df = self.snapshot.index_df
 
         fig = px.pie(
             allocation_df,
@@ -679,7 +1324,7 @@ class PortfolioAnalytics:
         day = 60 * 60 * 24
         if self.history_df is None:
             # get full history from api
-            min_time = (self.trades_df["date"].min() - pd.DateOffset(2)).timestamp()
+            min_time = (self.trade_log.column("date").min() - pd.DateOffset(2)).timestamp()
             from_timestamp = min_time
         elif self.last_history_update_month < time() - 60 * 60 * 24 * 2:  # t - 2days
             # get data from last month
@@ -699,10 +1344,12 @@ class PortfolioAnalytics:
             for coin in self.index_df["symbol"].str.lower():
                 id = self.markets.loc[self.markets["symbol"] == coin, ["id"]].values[0][0]
                 try:
-                    with retrying(
-                        self.coingecko.get_coin_market_chart_range_by_id,
-                        sleeptime=30,
-                        sleepscale=1,
+                    with metrics.retrying(
+                        self.coingecko.with_priority(BACKGROUND).get_coin_market_chart_range_by_id,
+                        provider="coingecko",
+                        endpoint="get_coin_market_chart_range_by_id",
+                        sleeptime=1,
+                        sleepscale=2,
                         jitter=0,
                         retry_exceptions=(requests.exceptions.HTTPError,),
                     ) as get_history:
@@ -761,64 +1408,26 @@ class PortfolioAnalytics:
             self.history_df = history_df
 
     def compute_value_history(self, from_timestamp=None):
-        if self.history_df is None:
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.history_df is None:
             raise ValueError
-        if from_timestamp is not None:
-            start_time = pd.to_datetime(from_timestamp, unit="s", utc=True)
-            price_history = self.history_df.copy().truncate(before=start_time)
-        else:
-            price_history = self.history_df.copy()
-            start_time = price_history.index.min()
-        if start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=31)):
-            freq = "D"
-        elif start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=14, minutes=2)):
-            freq = "3H"
-        elif start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=1, minutes=2)):
-            freq = "H"
-        else:
-            freq = "5T"  # 5 minutes
-
-        price_history = price_history.resample(freq, origin="end").ffill()
-        # add most recent prices for data consistency
-        current_prices = [
-            self.markets.loc[self.markets["symbol"] == symbol, ["current_price"]].values[0][0]
-            for symbol in list(price_history.columns)
-        ]
-        current_prices = pd.DataFrame(
-            [current_prices],
-            columns=price_history.columns,
-            index=[pd.Timestamp.now(tz="utc")],
-        )
-        price_history = pd.concat([price_history, current_prices]).sort_index()
-        if start_time + pd.Timedelta(days=2) < price_history.index.min():
-            zero_row = pd.DataFrame(0, index=[start_time], columns=price_history.columns)
-            price_history = pd.concat([price_history, zero_row]).sort_index()
-        price_history.index = pd.to_datetime(price_history.index, utc=True).tz_convert(tz="Europe/Berlin")
-
-        invested = (
-            self.trades_df[["date", "buy_symbol", self.base_cost_row]]
-            .groupby(["date", "buy_symbol"], as_index=False, axis=0)
-            .sum(numeric_only=True)
-        )
-        value = (
-            self.trades_df[["date", "buy_symbol", "amount"]]
-            .groupby(["date", "buy_symbol"], as_index=False, axis=0)
-            .sum(numeric_only=True)
+        start_time = pd.to_datetime(from_timestamp, unit="s", utc=True) if from_timestamp is not None else None
+        current_prices = snapshot.markets.drop_duplicates("symbol").set_index("symbol")["current_price"]
+        trades = snapshot.trades_df
+        recent_trades = trades.loc[trades["date"] >= history_cutoff(start_time or snapshot.history_df.index.min())]
+        return self.compute_pool.run(
+            value_history,
+            snapshot.history_df,
+            current_prices.reindex(snapshot.history_df.columns),
+            snapshot.daily_summary,
+            recent_trades,
+            snapshot.base_cost_row,
+            start_time,
         )
-        invested = invested.pivot(index="date", columns="buy_symbol", values=self.base_cost_row)
-        invested = invested.cumsum().fillna(method="ffill").fillna(0)
-        invested = invested.reindex(price_history.index, method="ffill").fillna(0)
-        invested.columns = invested.columns.str.lower()
-
-        value = value.pivot(index="date", columns="buy_symbol", values="amount")
-        value = value.cumsum().fillna(method="ffill").fillna(0)
-        value = value.reindex(price_history.index, method="ffill").fillna(0)
-        value.columns = value.columns.str.lower()
-        value = value * price_history
-
-        return value, invested
 
     def value_history_chart(self, as_image=False, from_timestamp=None, title=True):
+        import plotly.express as px
+
         try:
             value, invested = self.compute_value_history(from_timestamp=from_timestamp)
         except ValueError:
@@ -871,6 +1480,8 @@ class PortfolioAnalytics:
             return fig
 
     def performance_chart(self, as_image=False, from_timestamp=None, title=True):
+        import plotly.express as px
+
         try:
             value, invested = self.compute_value_history(from_timestamp=from_timestamp)
         except ValueError:
@@ -992,44 +1603,57 @@ class PortfolioAnalytics:
         return symbols, weights
 
     # Export all trades in a Parqet (Portfolio Tool) compatible format
-    def trades_csv_export(self, since: Optional[datetime] = None):
-        cols = [
-            "datetime",
-            "price",
-            "shares",
-            "tax",
-            "fee",
-            "type",
-            "assettype",
-            "identifier",
-            "currency",
-        ]
-        export = pd.DataFrame(columns=cols)
-        export["datetime"] = self.trades_df["date"]
-        export["price"] = self.trades_df["cost_eur"] / self.trades_df["amount"]
-        export["shares"] = self.trades_df["amount"]
-        export["tax"] = 0
-
-        def get_fee(row: pd.Series):
-            if row["fee"] == 0 or math.isnan(row["fee"]):
-                return 0
-            if (
-                row["fee_symbol"] == "EUR"
-                or len(str(row["fee_symbol"])) == 0
-                or isinstance(row["fee_symbol"], float)
-            ):
-                # assuming that the fee is in euros if no other fee symbol is given!
-                return row["fee"]
-            return self.convert(row["fee"], row["fee_symbol"], "EUR")
-
-        export["fee"] = self.trades_df[["fee", "fee_symbol"]].apply(get_fee, axis=1)
-        export["type"] = "Buy"
-        export["assettype"] = "Crypto"
-        export["identifier"] = self.trades_df["buy_symbol"]
-        export["currency"] = "EUR"
+    def parqet_export(self, trades_df: pd.DataFrame, fee_rates: dict) -> pd.DataFrame:
+        # symbols are compared upper case, like convert() does
+        fee_symbol = trades_df["fee_symbol"].astype(object).fillna("").astype(str).str.upper()
+        # assuming that the fee is in euros if no other fee symbol is given!
+        in_euro = fee_symbol.isin(["EUR", ""])
+        fee_rate = fee_symbol.map(fee_rates).where(~in_euro, 1.0)
+        return pd.DataFrame(
+            {
+                "datetime": trades_df["date"],
+                "price": trades_df["cost_eur"] / trades_df["amount"],
+                "shares": trades_df["amount"],
+                "tax": 0,
+                "fee": (trades_df["fee"].fillna(0) * fee_rate).fillna(0),
+                "type": "Buy",
+                "assettype": "Crypto",
+                "identifier": trades_df["buy_symbol"],
+                "currency": "EUR",
+            }
+        )
+
+    def export_trades(self, since: Optional[datetime] = None) -> Tuple[pd.DataFrame, dict]:
+        trades_df = self.snapshot.trades_df
         if since is not None:
-            export = export.loc[export["datetime"] >= since]
-        return export
+            trades_df = trades_df.loc[trades_df["date"] >= since]
+        fee_symbols = trades_df.loc[trades_df["fee"].fillna(0) != 0, "fee_symbol"].dropna().astype(str).str.upper()
+        fee_rates = self.conversion_rates(fee_symbols[~fee_symbols.isin(["EUR", ""])], "EUR")
+        unknown = sorted(symbol for symbol, rate in fee_rates.items() if np.isnan(rate))
+        if len(unknown) > 0:
+            # a fee of 0 in the tax export would be wrong without notice
+            raise ValueError(f"No conversion rate to EUR for the fee symbols {', '.join(unknown)}")
+        return trades_df, fee_rates
+
+    def trades_csv_export(self, since: Optional[datetime] = None) -> pd.DataFrame:
+        return self.parqet_export(*self.export_trades(since))
+
+    def trades_csv_chunks(self, since: Optional[datetime] = None, chunk_size: int = 1000):
+        """
+        Parqet CSV export as a generator of text chunks, only `chunk_size` rows are converted at a time.
+        The fee conversion rates are fetched before the generator is returned, so API errors and fee symbols
+        without conversion rate are raised here.
+        """
+        trades_df, fee_rates = self.export_trades(since)
+        csv_options = dict(sep=";", index=False, float_format="%.12f", date_format="%Y-%m-%dT%H:%M:%SZ")
+
+        def chunks():
+            yield self.parqet_export(trades_df.iloc[:0], fee_rates).to_csv(**csv_options)
+            for start in range(0, len(trades_df), chunk_size):
+                chunk = trades_df.iloc[start : start + chunk_size]
+                yield self.parqet_export(chunk, fee_rates).to_csv(header=False, **csv_options)
+
+        return chunks()
 
     """
     return: sorted array of top n non-stablecoin crypto by market cap
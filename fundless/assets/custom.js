@@ -44,6 +44,14 @@ window.dash_clientside.ui = {
         }, 155);
     },
 
+    // re-layout masonry after the cards were replaced, e.g. by switching the page of the trades page
+    reload_masonry: function (children) {
+        const $masonry = $('#cards');
+        setTimeout(function () {
+            $masonry.masonry().masonry('reloadItems').masonry('layout')
+        }, 155);
+    },
+
     // generate a nivo bar chart to describe coins in the index
     // create_index_bar: function (input, plot_data = {data}) {
     //     return <ResponsiveBar
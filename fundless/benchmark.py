@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import logging
+from threading import Event
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from dash.development.base_component import Component
+
+from analytics import PortfolioAnalytics, compact_markets
+from computations import ComputePool
+from config import Config, TradingBotConfig, TelegramBotConfig, DashboardConfig, ExchangeEnum
+import layouts
+from profiling import payload_size
+
+"""
+
+Render benchmark for the dashboard page builders in layouts.py
+
+Builds every page against a synthetic PortfolioAnalytics instance of configurable size (no network access needed)
+and reports build time, number of Dash components and the size of the serialized JSON payload.
+Run from the projects root directory: `python3 fundless/benchmark.py --coins 30 --days 1000`
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureExchange:
+    # Minimal stand-in for a ccxt exchange, providing the attributes used by the page builders
+    def __init__(self, symbols: List[str], base_symbol: str):
+        self.name = "Binance"
+        self.symbols = [f"{symbol.upper()}/{base_symbol.upper()}" for symbol in symbols]
+        self.markets = {symbol: {} for symbol in self.symbols}
+
+
+class FixtureExchanges:
+    def __init__(self, exchange: FixtureExchange):
+        self.active = exchange
+        self.authorized_exchanges = {ExchangeEnum.binance: exchange}
+
+
+def fixture_analytics(n_coins: int = 30, n_days: int = 365, trades_per_day: int = 10, seed: int = 0):
+    """Create a PortfolioAnalytics instance filled with synthetic market and trade data"""
+    rng = np.random.default_rng(seed)
+    n_markets = max(n_coins, 500)
+    symbols = [f"c{i:03d}" for i in range(n_markets)]
+    held = symbols[:n_coins]
+
+    config = Config.construct(
+        trading_bot_config=TradingBotConfig(
+            exchange=ExchangeEnum.binance,
+            base_currency="EUR",
+            base_symbol="eur",
+            savings_plan_cost=50,
+            savings_plan_interval=[5, 20],
+            savings_plan_execution_time="12:30",
+            portfolio_mode="cherry_pick",
+            portfolio_weighting="market_cap",
+            cherry_pick_symbols=held,
+        ),
+        telegram_bot_config=TelegramBotConfig(),
+        dashboard_config=DashboardConfig(dashboard=True, domain_name="localhost", login_provider="custom"),
+        secrets=None,
+    )
+
+    # bypass __init__, which would load files and fetch data from the APIs
+    analytics = PortfolioAnalytics.__new__(PortfolioAnalytics)
+    analytics.init_time = perf_counter()
+    analytics.ready = Event()
+    analytics.config = config
+    analytics.init_config_parameters()
+    analytics.compute_pool = ComputePool(processes=0)
+    analytics.exchanges = FixtureExchanges(FixtureExchange(symbols, config.trading_bot_config.base_symbol))
+    analytics.exchange_balance = {"amount": {"EUR": 1000.0}, "converted": {"EUR": 1000.0}}
+
+    market_caps = np.sort(rng.lognormal(mean=20, sigma=2, size=n_markets))[::-1]
+    analytics.cross_rates = {}
+    analytics.apply_markets(
+        compact_markets(
+            pd.DataFrame(
+                {
+                    "id": [f"coin-{symbol}" for symbol in symbols],
+                    "symbol": symbols,
+                    "name": [f"Coin {symbol.upper()}" for symbol in symbols],
+                    "image": [f"https://example.com/{symbol}.png" for symbol in symbols],
+                    "current_price": rng.lognormal(mean=2, sigma=2, size=n_markets),
+                    "market_cap": market_caps,
+                }
+            )
+        ),
+        set(),
+    )
+
+    n_trades = n_days * trades_per_day
+    days = pd.Timestamp.now(tz="Europe/Berlin").floor("d") - pd.to_timedelta(
+        np.repeat(np.arange(n_days), trades_per_day), unit="D"
+    )
+    cost = rng.uniform(1, 100, size=n_trades)
+    price = rng.lognormal(mean=2, sigma=2, size=n_trades)
+    analytics.trades_df = pd.DataFrame(
+        {
+            "date": days + pd.to_timedelta(rng.integers(0, 60 * 60 * 24, size=n_trades), unit="s"),
+            "id": [str(i) for i in range(n_trades)],
+            "buy_symbol": rng.choice([symbol.upper() for symbol in held], size=n_trades),
+            "sell_symbol": "EUR",
+            "price": price,
+            "amount": cost / price,
+            "cost": cost,
+            "fee": cost * 0.001,
+            "fee_symbol": "EUR",
+            "cost_total": cost * 1.001,
+            analytics.base_cost_row: cost * 1.001,
+            "exchange": ExchangeEnum.binance.value,
+        }
+    ).sort_values("date", ignore_index=True)
+    analytics.daily_summary = analytics.compute_daily_summary(analytics.trades_df)
+    analytics.positions = analytics.compute_positions(analytics.daily_summary)
+
+    asyncio.run(analytics.update_index_df())
+    asyncio.run(analytics.update_portfolio_metrics())
+    analytics.publish_snapshot()
+    return analytics
+
+
+def count_components(layout) -> int:
+    if isinstance(layout, (list, tuple)):
+        return sum(count_components(element) for element in layout)
+    if isinstance(layout, Component):
+        return 1 + sum(1 for _ in layout._traverse())
+    return 0
+
+
+def page_builders() -> Dict[str, Callable]:
+    return {
+        "holdings_table": layouts.create_holdings_table,
+        "trades_page": layouts.create_trades_page,
+        "coin_buttons": layouts.create_coin_buttons,
+        "info_cards": layouts.create_info_cards,
+    }
+
+
+def run_benchmark(analytics: PortfolioAnalytics, repeat: int = 5) -> pd.DataFrame:
+    results = []
+    for name, builder in page_builders().items():
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            layout = builder(analytics)
+            timings.append(perf_counter() - start)
+        results.append(
+            {
+                "page": name,
+                "min_ms": min(timings) * 1000,
+                "mean_ms": np.mean(timings) * 1000,
+                "components": count_components(layout),
+                "payload_kb": payload_size(layout) / 1024,
+            }
+        )
+    return pd.DataFrame.from_records(results).set_index("page")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard page builders")
+    parser.add_argument("--coins", type=int, default=30, help="number of coins held in the portfolio")
+    parser.add_argument("--days", type=int, default=365, help="number of trading days in the trade history")
+    parser.add_argument("--trades-per-day", type=int, default=10, help="number of trades on each trading day")
+    parser.add_argument("--repeat", type=int, default=5, help="number of builds per page")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    fixture = fixture_analytics(n_coins=args.coins, n_days=args.days, trades_per_day=args.trades_per_day)
+    print(f"Portfolio fixture: {args.coins} coins, {len(fixture.trades_df)} trades on {args.days} days")
+    print(fixture.memory_report())
+    print(run_benchmark(fixture, repeat=args.repeat).to_string(float_format="{:,.1f}".format))
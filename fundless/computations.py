@@ -0,0 +1,118 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Callable, Optional, Tuple
+import logging
+
+import pandas as pd
+
+from metrics import metrics
+
+"""
+
+CPU heavy pandas computations of the dashboard, written as pure functions of their inputs,
+so that they can be run in worker processes without holding the GIL of the bot process
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class ComputePool:
+    """
+    Runs pure functions in a pool of worker processes, arguments and results are pickled (numpy buffers for
+    pandas). With `processes=0` or if the pool broke, the functions are run in the calling thread.
+    """
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def run(self, function: Callable, *args):
+        if self.processes == 0:
+            return function(*args)
+        with self._lock:
+            if self._executor is None:
+                # spawn, as forking a process with running threads is not safe
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            executor = self._executor
+        try:
+            with metrics.timer("compute_pool_duration_seconds", function=function.__name__):
+                return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            logger.error(f"Compute pool broke while running {function.__name__}, running it in process instead")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            return function(*args)
+
+
+def history_cutoff(start_time: pd.Timestamp) -> pd.Timestamp:
+    # resampling may place the first sample up to one period (a day at most) before the start time
+    return (start_time - pd.Timedelta(days=2)).floor("d")
+
+
+def value_history(
+    history_df: pd.DataFrame,
+    current_prices: pd.Series,
+    daily_summary: pd.DataFrame,
+    recent_trades: pd.DataFrame,
+    base_cost_row: str,
+    start_time: Optional[pd.Timestamp] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    value and invested amount of every coin over time, sampled according to the length of the time range.
+    `recent_trades` are the trades since `history_cutoff(start_time)`, the older trades are read from the daily
+    summary.
+    """
+    if start_time is not None:
+        price_history = history_df.truncate(before=start_time)
+    else:
+        price_history = history_df
+        start_time = price_history.index.min()
+    if start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=31)):
+        freq = "D"
+    elif start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=14, minutes=2)):
+        freq = "3H"
+    elif start_time < (pd.Timestamp.now(tz="utc") - pd.DateOffset(days=1, minutes=2)):
+        freq = "H"
+    else:
+        freq = "5T"  # 5 minutes
+
+    price_history = price_history.resample(freq, origin="end").ffill()
+    # add most recent prices for data consistency
+    current_prices = pd.DataFrame(
+        [current_prices.reindex(price_history.columns).values],
+        columns=price_history.columns,
+        index=[pd.Timestamp.now(tz="utc")],
+    )
+    price_history = pd.concat([price_history, current_prices]).sort_index()
+    if start_time + pd.Timedelta(days=2) < price_history.index.min():
+        zero_row = pd.DataFrame(0, index=[start_time], columns=price_history.columns)
+        price_history = pd.concat([price_history, zero_row]).sort_index()
+    price_history.index = pd.to_datetime(price_history.index, utc=True).tz_convert(tz="Europe/Berlin")
+
+    # trades before the cutoff precede all samples, so they are counted at the time of the days last trade, the
+    # recent trades at their exact time
+    cutoff = history_cutoff(start_time)
+    summary = daily_summary.loc[daily_summary["last_trade"] < cutoff].reset_index()
+    summary = summary.rename(columns={"last_trade": "date"})[["date", "buy_symbol", "amount", base_cost_row]]
+    recent_trades = recent_trades[["date", "buy_symbol", "amount", base_cost_row]].astype({"buy_symbol": str})
+    trades = pd.concat([summary, recent_trades], ignore_index=True)
+    trades = trades.groupby(["date", "buy_symbol"], as_index=False).sum(numeric_only=True)
+
+    invested = trades.pivot(index="date", columns="buy_symbol", values=base_cost_row)
+    invested = invested.cumsum().fillna(method="ffill").fillna(0)
+    invested = invested.reindex(price_history.index, method="ffill").fillna(0)
+    invested.columns = invested.columns.str.lower()
+
+    value = trades.pivot(index="date", columns="buy_symbol", values="amount")
+    value = value.cumsum().fillna(method="ffill").fillna(0)
+    value = value.reindex(price_history.index, method="ffill").fillna(0)
+    value.columns = value.columns.str.lower()
+    value = value * price_history
+
+    return value, invested
@@ -110,6 +110,12 @@ class DashboardConfig(BaseConfig):
     dashboard: bool
     domain_name: str
     login_provider: LoginProviderEnum
+    profile_callbacks: Optional[bool] = False
+    profile_directory: Optional[str] = "fundless/data/profiles"
+    profile_top_n: Optional[conint(gt=0)] = 10
+    workers: Optional[conint(gt=0)] = 1
+    snapshot_directory: Optional[str] = "fundless/data/snapshots"
+    compute_processes: Optional[conint(ge=0)] = 0
 
     @classmethod
     def from_config_yaml(cls, file_path):
@@ -131,6 +137,12 @@ class DashboardConfig(BaseConfig):
             dashboard=dictionary["dashboard"],
             domain_name=dictionary.get("domain_name", "localhost"),
             login_provider=dictionary["login_provider"].get("selected", LoginProviderEnum.custom),
+            profile_callbacks=dictionary.get("profiling", {}).get("enabled", False),
+            profile_directory=dictionary.get("profiling", {}).get("directory", "fundless/data/profiles"),
+            profile_top_n=dictionary.get("profiling", {}).get("top_n", 10),
+            workers=dictionary.get("workers", 1),
+            snapshot_directory=dictionary.get("snapshot_directory", "fundless/data/snapshots"),
+            compute_processes=dictionary.get("compute_processes", 0),
         )
         return self
 
@@ -152,6 +164,14 @@ class TradingBotConfig(BaseConfig):
     custom_weights: Optional[Dict[constr(to_lower=True), float]]
     index_top_n: Optional[conint(gt=0, le=100)]
     index_exclude_symbols: Optional[List[constr(to_lower=True)]]
+    coingecko_calls_per_minute: Optional[confloat(gt=0)] = 25
+    markets_ttl: Optional[confloat(ge=2)] = 60  # seconds
+    markets_full_refresh_ttl: Optional[confloat(ge=2)] = 900
+    markets_tracked_only: Optional[bool] = True
+    prices_ttl: Optional[confloat(ge=2)] = 10
+    exchange_markets_ttl: Optional[confloat(ge=0)] = 86400  # seconds
+    exchange_init_timeout: Optional[confloat(gt=0)] = 30  # seconds
+    exchange_markets_directory: Optional[str] = "fundless/data/exchange_markets"
     # base_fiat_symbols: List[str]  # TODO define fiat symbols here instead of in trading.py
     # usd_symbols = ['usd', 'usdt', 'busd', 'usdc', 'dai']
     # eur_symbols = ['eur', 'eurt']
@@ -217,6 +237,16 @@ class TradingBotConfig(BaseConfig):
             custom_weights=dictionary["portfolio"]["weighting"].get("custom", None),
             index_top_n=dictionary["portfolio"].get("index", {}).get("top_n", None),
             index_exclude_symbols=dictionary["portfolio"].get("index", {}).get("exclude_symbols", None),
+            coingecko_calls_per_minute=dictionary.get("coingecko_calls_per_minute", 25),
+            markets_ttl=dictionary.get("markets", {}).get("ttl", 60),
+            markets_full_refresh_ttl=dictionary.get("markets", {}).get("full_refresh_ttl", 900),
+            markets_tracked_only=dictionary.get("markets", {}).get("tracked_only", True),
+            prices_ttl=dictionary.get("markets", {}).get("prices_ttl", 10),
+            exchange_markets_ttl=dictionary.get("exchange_markets", {}).get("ttl", 86400),
+            exchange_init_timeout=dictionary.get("exchange", {}).get("init_timeout", 30),
+            exchange_markets_directory=dictionary.get("exchange_markets", {}).get(
+                "directory", "fundless/data/exchange_markets"
+            ),
         )
         return self
 
@@ -253,6 +283,8 @@ class SecretsStore(BaseConfig):
     telegram: TelegramToken
     dashboard_user: str
     dashboard_password: str
+    metrics_token: Optional[str] = None
+    session_secret: Optional[str] = None
 
     @classmethod
     def from_secrets_yaml(cls, file_path):
@@ -307,6 +339,8 @@ class SecretsStore(BaseConfig):
             ),
             dashboard_user=dictionary["dashboard"]["user"],
             dashboard_password=dictionary["dashboard"]["password"],
+            metrics_token=dictionary["dashboard"].get("metrics_token", None),
+            session_secret=dictionary["dashboard"].get("session_secret", None),
         )
         return self
 
@@ -1,5 +1,4 @@
 from typing import Final
-import secrets
 
 
 FIAT_SYMBOLS: Final = ["EUR", "USD", "GBP"]
@@ -31,5 +30,4 @@ class Auth0EnvNames:
     AUTH0_DOMAIN = "AUTH0_DOMAIN"
     AUTH0_AUDIENCE = "AUTH0_AUDIENCE"
     PROFILE_KEY = "profile"
-    SECRET_KEY = secrets.token_hex(24)
     JWT_PAYLOAD = "jwt_payload"
@@ -15,23 +15,37 @@ from dash_extensions.enrich import (
     ClientsideFunction,
 )
 from dash_extensions import DeferScript
+import gevent
+import hmac
 from gevent.pywsgi import WSGIServer
-from flask import render_template, redirect
+from flask import render_template, redirect, request, g
 import logging
+import multiprocessing
+import multiprocessing.connection
+import resource
+import secrets
+import socket
 import traceback
+from time import perf_counter, sleep
 from datetime import datetime, timedelta
 import pytz
 
 # local imports
 from config import Config
 from analytics import PortfolioAnalytics
+from exchanges import ReadOnlyExchanges
+from snapshot_store import SnapshotStore
 import layouts
 from login import LoginProvider
-from constants import Auth0EnvNames, STABLE_COINS
+from constants import STABLE_COINS
+from metrics import metrics
+from profiling import CallbackProfiler
 
 logger = logging.getLogger(__name__)
 
 APP_URL = "/app/"
+UPDATE_POLL_INTERVAL = 1  # seconds between checks for a new analytics data version
+KEEP_ALIVE_INTERVAL = 15  # seconds between keep-alive comments on idle update streams
 
 
 def app_path(page_name: str):
@@ -49,9 +63,9 @@ class Dashboard:
     analytics: PortfolioAnalytics
     config: Config
 
-    def __init__(self, config: Config, analytics: PortfolioAnalytics):
+    def __init__(self, config: Config, analytics: PortfolioAnalytics, secret_key: str):
         server = flask.Flask(__name__)
-        server.secret_key = Auth0EnvNames.SECRET_KEY
+        server.secret_key = secret_key
         external_stylesheets = [
             dbc.themes.LITERA,  # FLATLY, LITERA, YETI
             "https://unpkg.com/bootstrap-table@1.18.3/dist/bootstrap-table.min.css",
@@ -64,12 +78,17 @@ class Dashboard:
         self.server = server
         self.config = config
         self.analytics = analytics
-        self.login_provider = LoginProvider(config.dashboard_config, self.server, config.secrets)
+        self.login_provider = LoginProvider(config.dashboard_config, self.server, config.secrets, secret_key)
+        self.profiler = CallbackProfiler(
+            enabled=config.dashboard_config.profile_callbacks,
+            directory=config.dashboard_config.profile_directory,
+            top_n=config.dashboard_config.profile_top_n,
+        )
 
         # Preload data heavy figures
         self.allocation_chart = self.analytics.allocation_pie(title=False)
-        self.history_chart = self.analytics.value_history_chart(title=False)
-        self.performance_chart = self.analytics.performance_chart(title=False)
+        # rendered charts by (analytics snapshot version, time range, tab), only the latest version is kept
+        self.chart_cache = {}
 
         ########################################################################################################
         #                                        Static Routes                                                 #
@@ -104,6 +123,87 @@ class Dashboard:
         def view_dashboard_again():
             return redirect("/app")
 
+        def metrics_response():
+            # ru_maxrss is given in kilobytes on linux
+            metrics.set(
+                "process_max_resident_memory_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            )
+            self.analytics.update_memory_metrics()
+            return flask.Response(metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+        metrics_for_users = self.login_provider.requires_auth(metrics_response)
+
+        @server.route("/metrics")
+        def metrics_endpoint():
+            # Prometheus scrape endpoint, for scrapers with the metrics token (bearer) or logged in users
+            token = self.config.secrets.metrics_token
+            authorization = request.headers.get("Authorization", "")
+            if token is not None and hmac.compare_digest(authorization, f"Bearer {token}"):
+                return metrics_response()
+            return metrics_for_users()
+
+        @server.route("/updates")
+        @self.login_provider.requires_auth
+        def update_events():
+            # server sent events, notifying the dashboard about new analytics data versions
+            def stream():
+                version = None
+                idle = 0
+                while True:
+                    if self.analytics.data_version != version:
+                        version = self.analytics.data_version
+                        idle = 0
+                        yield f"data: {version}\n\n"
+                    elif idle >= KEEP_ALIVE_INTERVAL:
+                        idle = 0
+                        yield ": keep-alive\n\n"
+                    gevent.sleep(UPDATE_POLL_INTERVAL)
+                    idle += UPDATE_POLL_INTERVAL
+
+            return flask.Response(
+                stream(),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @server.route("/export/trades.csv")
+        @self.login_provider.requires_auth
+        def export_trades_csv():
+            # streamed Parqet CSV export, the time range is given as number of days (default: everything)
+            days = request.args.get("days", type=int)
+            since = datetime.now(tz=pytz.timezone("Europe/Berlin")) - timedelta(days=days) if days else None
+            try:
+                chunks = self.analytics.trades_csv_chunks(since=since)
+            except ValueError as e:
+                logger.error(f"Trades export failed: {e}")
+                return flask.Response(f"Trades export failed: {e}", status=500, mimetype="text/plain")
+            return flask.Response(
+                flask.stream_with_context(chunks),
+                mimetype="text/csv",
+                headers={"Content-Disposition": "attachment; filename=fundless_export.csv"},
+            )
+
+        @server.before_request
+        def start_request_timer():
+            g.request_start = perf_counter()
+
+        @server.after_request
+        def record_request_duration(response):
+            if "request_start" not in g:
+                return response
+            duration = perf_counter() - g.request_start
+            if request.path.endswith("_dash-update-component"):
+                # dash callback, label the render time by the callbacks output
+                payload = request.get_json(silent=True) or {}
+                metrics.observe("dash_callback_duration_seconds", duration, output=payload.get("output", ""))
+            else:
+                metrics.observe(
+                    "http_request_duration_seconds",
+                    duration,
+                    endpoint=request.url_rule.rule if request.url_rule is not None else "unknown",
+                )
+            return response
+
         @server.route("/logout")
         @server.route("/app/logout")
         @self.login_provider.requires_auth
@@ -189,10 +289,10 @@ class Dashboard:
         ########################################################################################################
 
         # Update pie chart and info cards (quick)
-        @self.app.callback(
+        @self.callback(
             Output("allocation_chart", "figure"),
             Output("info_cards", "children"),
-            Input("update-interval", "n_intervals"),
+            Input("update-events", "message"),
         )
         def update_charts_quick(_):
             self.allocation_chart = analytics.allocation_pie(title=False)
@@ -200,50 +300,54 @@ class Dashboard:
 
             return self.allocation_chart, info_cards
 
-        @self.app.callback(
+        @self.callback(
             Output("holdings_table", "children"),
-            Input("holdings-update-interval", "n_intervals"),
+            Input("holdings-update-events", "message"),
         )
         def update_holdings(_):
             return layouts.create_holdings_table(self.analytics)
 
         # Update performance and history charts
-        @self.app.callback(
+        @self.callback(
             Output("chart", "figure"),
-            Input("update-interval", "n_intervals"),
+            Input("update-events", "message"),
             Input("chart_time_range", "value"),
             Input("chart_tabs", "active_tab"),
         )
         def update_charts_slow(_, chart_range, active_tab):
+            version = self.analytics.snapshot.version
+            key = (version, chart_range, active_tab)
+            if key in self.chart_cache:
+                return self.chart_cache[key]
             try:
                 timestamp = analytics.get_timestamp(chart_range)
-                self.performance_chart = self.analytics.performance_chart(from_timestamp=timestamp, title=False)
-                self.history_chart = analytics.value_history_chart(from_timestamp=timestamp, title=False)
                 if active_tab == "history_tab":
-                    chart = self.history_chart
+                    chart = analytics.value_history_chart(from_timestamp=timestamp, title=False)
                 elif active_tab == "performance_tab":
-                    chart = self.performance_chart
+                    chart = self.analytics.performance_chart(from_timestamp=timestamp, title=False)
                 else:
                     logger.warning("Invalid tab selected!")
-                    chart = None
+                    return None
+                cache = {cached: figure for cached, figure in self.chart_cache.items() if cached[0] == version}
+                cache[key] = chart
+                self.chart_cache = cache
             except Exception:
                 logger.error("Error in performance/history chart update callback!")
                 logger.error(traceback.format_exc())
                 raise
             return chart
 
-        @self.app.callback(Input("accounting_currency_select", "value"))
+        @self.callback(Input("accounting_currency_select", "value"))
         def set_base_currency(value):
             if self.config.trading_bot_config.base_currency.value.lower() != value.lower():
                 logger.debug("Updating config!")
                 self.config.trading_bot_config.base_currency = value  # this also changes the config in analytics
                 self.analytics.update_config(base_currency_changed=True)
-                self.performance_chart = {}
-                self.history_chart = {}
+                self.chart_cache = {}
             else:
                 logger.debug("Not updating config!")
 
-        @self.app.callback(
+        @self.callback(
             Input("quote_select", "value"),
             Output("coin_selection_buttons", "children"),
             Output("savings_plan_info", "children"),
@@ -254,7 +358,7 @@ class Dashboard:
             self.config.trading_bot_config.base_symbol = sym
             return layouts.create_coin_buttons(analytics), layouts.savings_plan_info(analytics)
 
-        @self.app.callback(
+        @self.callback(
             Input("exchange_select", "value"),
             Output("savings_plan_info", "children"),
             Output("coin_selection_buttons", "children"),
@@ -267,7 +371,7 @@ class Dashboard:
             logger.info(f"Changed exchange to {self.analytics.exchanges.active.name}")
             return layouts.savings_plan_info(analytics, force_update=True), layouts.create_coin_buttons(analytics)
 
-        @self.app.callback(Input("volume", "value"), Output("savings_plan_info", "children"))
+        @self.callback(Input("volume", "value"), Output("savings_plan_info", "children"))
         def set_volume(vol):
             if vol is not None:
                 if vol == self.config.trading_bot_config.savings_plan_cost:
@@ -275,7 +379,7 @@ class Dashboard:
                 self.config.trading_bot_config.savings_plan_cost = float(vol)
             return layouts.savings_plan_info(analytics)
 
-        @self.app.callback(
+        @self.callback(
             Input("weighting", "value"),
             Output("custom-weighting-collapse", "is_open"),
             Output("chart_savings_plan_allocations", "children"),
@@ -287,7 +391,7 @@ class Dashboard:
             else:
                 return False, layouts.savings_plan_weight_chart(analytics)
 
-        @self.app.callback(
+        @self.callback(
             Input("custom-weighting-collapse", "is_open"),
             Output("custom_form", "children"),
         )
@@ -297,7 +401,7 @@ class Dashboard:
             else:
                 return dash.no_update
 
-        @self.app.callback(
+        @self.callback(
             Input({"type": "btn-coin-select", "index": MATCH}, "n_clicks"),
             State({"type": "btn-coin-select", "index": MATCH}, "active"),
             Output({"type": "btn-coin-select", "index": MATCH}, "active"),
@@ -308,7 +412,7 @@ class Dashboard:
                     return not active
             return dash.no_update
 
-        @self.app.callback(
+        @self.callback(
             Input({"type": "btn-coin-select", "index": ALL}, "n_clicks"),
             State({"type": "btn-coin-select", "index": ALL}, "value"),
             State({"type": "btn-coin-select", "index": ALL}, "active"),
@@ -352,7 +456,7 @@ class Dashboard:
                     if value not in top_9:
                         additional_options = [
                             {"label": analytics.get_coin_name(sym), "value": sym}
-                            for sym in analytics.markets.symbol.values
+                            for sym in analytics.snapshot.markets.symbol.values
                             if sym not in self.config.trading_bot_config.cherry_pick_symbols
                             and sym not in top_9
                             and sym.upper() not in STABLE_COINS
@@ -366,61 +470,7 @@ class Dashboard:
                 additional_options,
             )
 
-        @self.app.callback(
-            Output("download-dataframe-csv", "data"),
-            [Input("btn_csv_all", "n_clicks")],
-            prevent_initial_call=True,
-        )
-        def export_csv_all(n_clicks):
-            if n_clicks < 1:
-                return
-            data = dcc.send_data_frame(
-                self.analytics.trades_csv_export().to_csv,
-                "fundless_export.csv",
-                sep=";",
-                index=False,
-                float_format="%.12f",
-                date_format="%Y-%m-%dT%H:%M:%SZ",
-            )
-            return data
-
-        @self.app.callback(
-            Output("download-dataframe-csv", "data"),
-            [Input("btn_csv_3", "n_clicks")],
-            prevent_initial_call=True,
-        )
-        def export_csv_3(n_clicks):
-            if n_clicks < 1:
-                return
-            since = datetime.now(tz=pytz.timezone("Europe/Berlin")) - timedelta(days=91)
-            return dcc.send_data_frame(
-                self.analytics.trades_csv_export(since=since).to_csv,
-                "fundless_export.csv",
-                sep=";",
-                index=False,
-                float_format="%.12f",
-                date_format="%Y-%m-%dT%H:%M:%SZ",
-            )
-
-        @self.app.callback(
-            Output("download-dataframe-csv", "data"),
-            [Input("btn_csv_month", "n_clicks")],
-            prevent_initial_call=True,
-        )
-        def export_csv_month(n_clicks):
-            if n_clicks < 1:
-                return
-            since = datetime.now(tz=pytz.timezone("Europe/Berlin")) - timedelta(days=30)
-            return dcc.send_data_frame(
-                self.analytics.trades_csv_export(since=since).to_csv,
-                "fundless_export.csv",
-                sep=";",
-                index=False,
-                float_format="%.12f",
-                date_format="%Y-%m-%dT%H:%M:%SZ",
-            )
-
-        @self.app.callback(
+        @self.callback(
             Input("dropdown_add_coin", "value"),
             State("dropdown_add_coin", "options"),
             Output("dropdown_add_coin", "value"),
@@ -443,7 +493,7 @@ class Dashboard:
                 )
             return dash.no_update
 
-        @self.app.callback(
+        @self.callback(
             Output({"type": "card-collapse", "index": MATCH}, "is_open"),
             Output({"type": "card-toggle", "index": MATCH}, "children"),
             Input({"type": "card-toggle", "index": MATCH}, "n_clicks"),
@@ -462,9 +512,22 @@ class Dashboard:
             Input({"type": "card-collapse", "index": ALL}, "is_open"),
         )
 
+        @self.callback(
+            Output("cards", "children"),
+            Input("trades-pagination", "active_page"),
+            prevent_initial_call=True,
+        )
+        def change_trades_page(active_page):
+            return layouts.create_trade_cards(self.analytics, page=active_page or 1)
+
+        self.app.clientside_callback(
+            ClientsideFunction("ui", "reload_masonry"),
+            Input("cards", "children"),
+        )
+
         # Page forward callback
         @self.login_provider.requires_auth
-        @self.app.callback(
+        @self.callback(
             Output("page-content", "children"),
             Output("redirect", "href"),
             [Input("url", "pathname")],
@@ -505,6 +568,13 @@ class Dashboard:
                 view = layouts.create_404(pathname)
             return view, forward
 
+    def callback(self, *args, **kwargs):
+        # register a dash callback, wrapped by the (opt-in) callback profiler
+        def decorator(func):
+            return self.app.callback(*args, **kwargs)(self.profiler.wrap(func))
+
+        return decorator
+
     def run_dashboard(self):
         if "localhost" in self.config.dashboard_config.domain_name:
             logger.info("Webapp is available on localhost:3000")
@@ -526,3 +596,59 @@ class Dashboard:
                 self.server,
             )
             http_server.serve_forever()
+
+    def run_dashboard_worker(self, port: int = 80):
+        # several worker processes listen on the same port, the kernel distributes the connections between them
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind(("0.0.0.0", port))
+        listener.listen(socket.SOMAXCONN)
+        WSGIServer(listener, self.server).serve_forever()
+
+
+def session_secret_key(config: Config) -> str:
+    # generated once per bot process, unless configured, and shared with all dashboard workers
+    return config.secrets.session_secret or secrets.token_hex(24)
+
+
+def dashboard_worker(config: Config, port: int, secret_key: str):
+    # entry point of a dashboard worker process
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s[%(process)d] %(levelname)s %(message)s")
+    exchanges = ReadOnlyExchanges(config)
+    store = SnapshotStore(config.dashboard_config.snapshot_directory)
+    analytics = PortfolioAnalytics.from_snapshot_store(config, exchanges, store)
+    while not analytics.wait_until_ready():
+        logger.error("Dashboard worker start delayed, the bot process has not published any analytics data yet")
+    dashboard = Dashboard(config, analytics, secret_key)
+    dashboard.run_dashboard_worker(port)
+
+
+def run_dashboard_workers(config: Config, port: int = 80):
+    """
+    Serve the dashboard from `config.dashboard_config.workers` processes, which read the analytics data published
+    by the bot process. Settings changed in the dashboard only apply to the worker process handling the request,
+    they are neither shared with the other workers nor with the trading bot.
+    """
+    n_workers = config.dashboard_config.workers
+    logger.info(f"Webapp is available on port {port}, served by {n_workers} worker processes")
+    logger.warning("Settings changed in the dashboard are not applied to the trading bot in multi worker mode!")
+    context = multiprocessing.get_context("spawn")
+    secret_key = session_secret_key(config)
+
+    def start_worker(i: int):
+        worker = context.Process(
+            target=dashboard_worker, args=(config, port, secret_key), name=f"dashboard-worker-{i}", daemon=True
+        )
+        worker.start()
+        return worker
+
+    workers = [start_worker(i) for i in range(n_workers)]
+    while True:
+        # restart crashed workers
+        multiprocessing.connection.wait([worker.sentinel for worker in workers])
+        sleep(5)
+        for i, worker in enumerate(workers):
+            if not worker.is_alive():
+                logger.error(f"{worker.name} exited with code {worker.exitcode}, restarting it")
+                workers[i] = start_worker(i)
@@ -1,36 +1,160 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+
 import ccxt
 from config import ExchangeEnum, Config
+from metrics import metrics, InstrumentedClient
+from market_cache import MarketCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEGRADED_RETRY_INTERVAL = 60  # seconds, doubled after every failed retry of the degraded exchanges
+DEGRADED_MAX_RETRY_INTERVAL = 60 * 60
+
+
+def markets_name(exchange_name: ExchangeEnum, test_mode: bool) -> str:
+    # name of the exchange in the market cache, testnets have their own markets
+    return f"{exchange_name.value}_test" if test_mode else exchange_name.value
+
 
 class Exchanges:
-    authorized_exchanges: dict = {}
+    authorized_exchanges: Dict[ExchangeEnum, ccxt.Exchange]
+    degraded: Dict[ExchangeEnum, str]  # unreachable at startup or with invalid API tokens, with the reason
     active: ccxt.Exchange
 
     def __init__(self, config: Config):
         self.secrets = config.secrets
         self.trading_config = config.trading_bot_config
+        self.market_cache = MarketCache(
+            self.trading_config.exchange_markets_directory, ttl=self.trading_config.exchange_markets_ttl
+        )
+        self.authorized_exchanges = {}
+        self.degraded = {}
+        self.unverified = []  # exchanges with markets from the cache, their API tokens were not used yet
+        self.unreachable = set()  # degraded exchanges, that are retried in the background
 
-        for exchange_token in self.secrets.get_exchange_tokens(test_mode=self.trading_config.test_mode):
-            if not self.init_exchange(exchange_name=exchange_token["exchange"]):
-                logger.warning(f"No valid API tokens for exchange {exchange_token['exchange'].values[1]}")
+        # initialize the exchanges concurrently, the results are collected here in the main thread
+        exchange_names = [
+            token["exchange"]
+            for token in self.secrets.get_exchange_tokens(test_mode=self.trading_config.test_mode)
+        ]
+        futures = {name: self.init_in_background(name) for name in exchange_names}
+        deadline = monotonic() + self.trading_config.exchange_init_timeout
+        for exchange_name, future in futures.items():
+            try:
+                exchange = future.result(timeout=max(deadline - monotonic(), 0))
+            except FutureTimeoutError:
+                self.degrade(exchange_name, f"no response within {self.trading_config.exchange_init_timeout:g}s")
+                self.unreachable.add(exchange_name)
+                continue
+            except ccxt.BaseError as e:
+                self.degrade(exchange_name, str(e))
+                self.unreachable.add(exchange_name)
+                continue
+            if exchange is None:
+                logger.warning(f"No valid API tokens for exchange {exchange_name.values[1]}")
+            else:
+                self.authorized_exchanges[exchange_name] = exchange
 
         if self.trading_config.exchange not in self.authorized_exchanges.keys():
+            if self.trading_config.exchange in self.degraded:
+                raise RuntimeWarning(
+                    f"Selected exchange {self.trading_config.exchange.values[1]} is not available: "
+                    f"{self.degraded[self.trading_config.exchange]}"
+                )
             raise RuntimeWarning(
                 f"No valid API tokens for selected exchange {self.trading_config.exchange.values[1]}"
             )
         else:
             self.active = self.authorized_exchanges[self.trading_config.exchange]
 
-        logger.info("List of exchanges with validated API tokens:")
+        logger.info("List of exchanges with API tokens:")
         logger.info([exchange.values[1] for exchange in self.authorized_exchanges.keys()])
+        unverified = [name for name in self.unverified if name in self.authorized_exchanges]
+        if len(unverified) > 0:
+            Thread(target=self.check_credentials, args=(unverified,), name="exchange-auth", daemon=True).start()
+        if len(self.unreachable) > 0:
+            Thread(target=self.retry_unreachable, name="exchange-retry", daemon=True).start()
+
+    def init_in_background(self, exchange_name: ExchangeEnum) -> Future:
+        # a daemon thread, so that an exchange that does not respond does not block the interpreter exit
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.init_exchange(exchange_name=exchange_name))
+            except Exception as e:
+                future.set_exception(e)
+
+        Thread(target=run, name=f"exchange-init-{exchange_name.value}", daemon=True).start()
+        return future
+
+    def degrade(self, exchange_name: ExchangeEnum, reason: str):
+        logger.warning(f"Exchange {exchange_name.values[1]} is not available, skipping it: {reason}")
+        self.degraded[exchange_name] = reason
+        metrics.inc("exchange_degraded_total", exchange=exchange_name.value)
+
+    def check_credentials(self, exchange_names: List[ExchangeEnum]):
+        # a cheap authenticated request, exchanges with invalid API tokens are removed from the authorized ones
+        for exchange_name in exchange_names:
+            try:
+                self.authorized_exchanges[exchange_name].fetch_balance()
+            except ccxt.AuthenticationError as e:
+                # replaced rather than modified, as it might be iterated by another thread
+                self.authorized_exchanges = {
+                    name: exchange for name, exchange in self.authorized_exchanges.items() if name != exchange_name
+                }
+                self.degrade(exchange_name, f"invalid API tokens: {e}")
+                if exchange_name == self.trading_config.exchange:
+                    logger.error(
+                        f"Invalid API tokens for selected exchange {exchange_name.values[1]}, no orders are "
+                        "placed until they are fixed and the bot is restarted"
+                    )
+            except ccxt.BaseError as e:
+                logger.warning(f"Could not check the API tokens of exchange {exchange_name.values[1]}: {e}")
+
+    def active_error(self) -> Optional[str]:
+        # reason why the selected exchange can't be traded on, e.g. its API tokens turned out to be invalid
+        if self.trading_config.exchange in self.authorized_exchanges:
+            return None
+        return self.degraded.get(self.trading_config.exchange, "no valid API tokens")
+
+    def retry_unreachable(self):
+        # runs in a background thread, until all exchanges that were unreachable at startup are initialized
+        interval = DEGRADED_RETRY_INTERVAL
+        while len(self.unreachable) > 0:
+            sleep(interval)
+            futures = {name: self.init_in_background(name) for name in self.unreachable}
+            deadline = monotonic() + self.trading_config.exchange_init_timeout
+            for exchange_name, future in futures.items():
+                try:
+                    exchange = future.result(timeout=max(deadline - monotonic(), 0))
+                except FutureTimeoutError:
+                    logger.info(f"Exchange {exchange_name.values[1]} is still not available: no response")
+                    continue
+                except ccxt.BaseError as e:
+                    logger.info(f"Exchange {exchange_name.values[1]} is still not available: {e}")
+                    continue
+                self.unreachable.discard(exchange_name)
+                if exchange is None:
+                    logger.warning(f"No valid API tokens for exchange {exchange_name.values[1]}")
+                    continue
+                # replaced rather than modified, as it might be iterated by another thread
+                self.authorized_exchanges = {**self.authorized_exchanges, exchange_name: exchange}
+                self.degraded = {name: reason for name, reason in self.degraded.items() if name != exchange_name}
+                logger.info(f"Exchange {exchange_name.values[1]} is available again")
+                if exchange_name in self.unverified:
+                    self.check_credentials([exchange_name])
+            interval = min(2 * interval, DEGRADED_MAX_RETRY_INTERVAL)
 
     def init_exchange(
         self,
         exchange_name: ExchangeEnum,
-    ) -> bool:
+    ) -> Optional[ccxt.Exchange]:
+        # returns None for missing or invalid API tokens, runs in a worker thread
         if exchange_name == ExchangeEnum.binance:
             exchange = ccxt.binance()
             if self.trading_config.test_mode:
@@ -50,7 +174,7 @@ class Exchanges:
         elif exchange_name == ExchangeEnum.coinbasepro:
             exchange = ccxt.coinbasepro()
             if self.trading_config.test_mode:
-                return False  # Coinbase Pro does not have a test mode
+                return None  # Coinbase Pro does not have a test mode
             else:
                 exchange.apiKey = self.secrets.coinbasepro["api_key"]
                 exchange.secret = self.secrets.coinbasepro["secret"]
@@ -59,7 +183,7 @@ class Exchanges:
             exchange = ccxt.coinbase()
             exchange.options["createMarketBuyOrderRequiresPrice"] = False
             if self.trading_config.test_mode:
-                return False
+                return None
             else:
                 exchange.apiKey = self.secrets.coinbase["api_key"]
                 exchange.secret = self.secrets.coinbase["secret"]
@@ -70,15 +194,16 @@ class Exchanges:
             exchange.set_sandbox_mode(self.trading_config.test_mode)
         elif self.trading_config.test_mode:
             # Test mode is enabled, but current exchange does not support it
-            return False
+            return None
         if not exchange.check_required_credentials():
-            return False
+            return None
         try:
-            exchange.load_markets()
+            if self.market_cache.load(exchange, markets_name(exchange_name, self.trading_config.test_mode)):
+                self.unverified.append(exchange_name)
         except ccxt.AuthenticationError:
-            return False
-        self.authorized_exchanges[exchange_name] = exchange
-        return True
+            return None
+        # count API calls per exchange and endpoint
+        return InstrumentedClient(exchange, provider=exchange_name.value)
 
         # not_available = [symbol.upper() for symbol in self.trading_config.cherry_pick_symbols if
         #                  f'{symbol.upper()}/{self.trading_config.base_symbol.upper()}' not in
@@ -86,3 +211,42 @@ class Exchanges:
         # if len(not_available) > 0:
         #     logger.warning(f'Some of your cherry picked coins are not available on {self.exchange.name}:')
         #     logger.warning(not_available)
+
+    def refresh_markets(self):
+        """reload the markets of the active exchange in the background, if they are expired"""
+        self.market_cache.ensure_fresh(
+            self.active, markets_name(self.trading_config.exchange, self.trading_config.test_mode)
+        )
+
+
+class ReadOnlyExchanges:
+    """
+    Exchange handles of the dashboard worker processes. The clients have no API credentials and their markets are
+    read from the market cache of the bot process, so workers make no exchange requests at startup. The balances
+    are shared by the bot process with the analytics state.
+    """
+
+    authorized_exchanges: Dict[ExchangeEnum, ccxt.Exchange]
+    active: ccxt.Exchange
+
+    def __init__(self, config: Config):
+        self.trading_config = config.trading_bot_config
+        market_cache = MarketCache(
+            self.trading_config.exchange_markets_directory, ttl=self.trading_config.exchange_markets_ttl
+        )
+        self.authorized_exchanges = {}
+        for exchange_token in config.secrets.get_exchange_tokens(test_mode=self.trading_config.test_mode):
+            exchange_name = exchange_token["exchange"]
+            # the bot process only caches the markets of exchanges with valid API tokens
+            cached = market_cache.read(markets_name(exchange_name, self.trading_config.test_mode))
+            if cached is None:
+                continue
+            exchange = getattr(ccxt, exchange_name.value)()
+            exchange.set_markets(cached["markets"], cached["currencies"])
+            self.authorized_exchanges[exchange_name] = exchange
+        if self.trading_config.exchange not in self.authorized_exchanges:
+            # no markets cached yet, no coin is shown as available on the exchange
+            exchange = getattr(ccxt, self.trading_config.exchange.value)()
+            exchange.set_markets({})
+            self.authorized_exchanges[self.trading_config.exchange] = exchange
+        self.active = self.authorized_exchanges[self.trading_config.exchange]
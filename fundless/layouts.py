@@ -1,7 +1,7 @@
 from dash import dcc
 from dash import html
 import dash_bootstrap_components as dbc
-from dash_extensions import DeferScript
+from dash_extensions import DeferScript, EventSource
 from functools import reduce
 from itertools import groupby
 from operator import add
@@ -58,8 +58,8 @@ def create_dashboard(analytics: PortfolioAnalytics, allocation_pie):
                 ],
                 justify="center",
             ),
-            # update UI charts and info cards
-            dcc.Interval(id="update-interval", interval=3 * 1000, n_intervals=0),
+            # update UI charts and info cards, whenever the server announces new data
+            EventSource(id="update-events", url="/updates"),
         ]
     )
 
@@ -477,7 +477,7 @@ def create_holdings_page(analytics: PortfolioAnalytics):
     return html.Div(
         [
             html.Div(table_dbc, id="holdings_table"),
-            dcc.Interval(id="holdings-update-interval", interval=3 * 1000, n_intervals=0),
+            EventSource(id="holdings-update-events", url="/updates"),
             # DeferScript(src='https://unpkg.com/bootstrap-table@1.18.3/dist/bootstrap-table.min.js')
         ],
         style={"margin-top": "2rem"},
@@ -605,7 +605,7 @@ def savings_plan_info(analytics: PortfolioAnalytics, force_update=False):
 
 def create_coin_buttons(analytics: PortfolioAnalytics):
     buttons = []
-    for i, sym in enumerate(analytics.markets.symbol.values):
+    for i, sym in enumerate(analytics.snapshot.markets.symbol.values):
         try:
             top_n_coin = analytics.top_n(9).index(sym) + 1
         except ValueError:
@@ -695,7 +695,7 @@ def create_strategy_page(analytics: PortfolioAnalytics):
                                         "label": analytics.get_coin_name(sym),
                                         "value": sym,
                                     }
-                                    for sym in analytics.markets.symbol.values
+                                    for sym in analytics.snapshot.markets.symbol.values
                                     if not (
                                         sym in top_9
                                         or sym in analytics.config.trading_bot_config.cherry_pick_symbols
@@ -899,9 +899,14 @@ def create_weighting_sliders(analytics: PortfolioAnalytics):
     ]
 
 
-def create_trades_page(analytics: PortfolioAnalytics):
-    order_days = analytics.trades_df
-    order_days.date = order_days.date.dt.floor("d")
+TRADES_PAGE_SIZE = 12  # number of trading days shown on one page of the trades page
+
+
+def create_trade_cards(analytics: PortfolioAnalytics, page: int = 1):
+    snapshot = analytics.snapshot
+    summary = snapshot.daily_summary
+    days = summary.index.unique(level="day")[::-1]  # newest day first
+    base_currency = analytics.config.trading_bot_config.base_currency.values[1]
 
     def print_trade_text(coin, coin_orders):
         return html.Span(
@@ -909,16 +914,26 @@ def create_trades_page(analytics: PortfolioAnalytics):
                 f"{print_crypto_amount(coin_orders.amount)} ",
                 html.B(analytics.get_coin_name(coin, abbr=True)),
                 " for ",
-                f"{coin_orders[analytics.base_cost_row]:.2f} {analytics.config.trading_bot_config.base_currency.values[1]}",
+                f"{coin_orders[snapshot.base_cost_row]:.2f} {base_currency}",
             ],
             className="trade-card-text",
         )
 
-    masonry_cards = html.Div(
-        className="row",
-        id="cards",
-        **{"data-masonry": '{"percentPosition": true }'},
-        children=[
+    def trade_lines(coins):
+        return [
+            element
+            for coin, coin_orders in coins.iterrows()
+            for element in (
+                print_trade_text(coin, coin_orders),
+                html.Br(),
+            )
+        ]
+
+    cards = []
+    first = (page - 1) * TRADES_PAGE_SIZE
+    for i, date in enumerate(days[first : first + TRADES_PAGE_SIZE], start=first):
+        coins = summary.xs(date, level="day").sort_values("cost", ascending=False)
+        cards.append(
             html.Div(
                 className="col-sm-6 col-xl-4 mb-4 card-item",
                 children=dbc.Card(
@@ -926,7 +941,7 @@ def create_trades_page(analytics: PortfolioAnalytics):
                         dbc.CardBody(
                             [
                                 html.H4(
-                                    f"{orders[analytics.base_cost_row].sum():,.0f} {analytics.config.trading_bot_config.base_currency.values[1]} ",
+                                    f"{coins[snapshot.base_cost_row].sum():,.0f} {base_currency} ",
                                     className="card-title",
                                 ),
                                 html.H6(
@@ -940,41 +955,19 @@ def create_trades_page(analytics: PortfolioAnalytics):
                                             src=analytics.get_coin_image(sym),
                                             className="crypto-icon-small",
                                         )
-                                        for sym in orders.sort_values("cost", ascending=False).buy_symbol.unique()
+                                        for sym in coins.index
                                     ],
                                     className="coin-symbol-group",
                                 ),
                                 html.Hr(),
-                                *[
-                                    element
-                                    for coin, coin_orders in orders.groupby("buy_symbol", sort=False)
-                                    .sum(numeric_only=True)
-                                    .sort_values("cost", ascending=False)
-                                    .head(4)
-                                    .iterrows()
-                                    for element in (
-                                        print_trade_text(coin, coin_orders),
-                                        html.Br(),
-                                    )
-                                ],
+                                *trade_lines(coins.head(4)),
                                 dbc.Collapse(
-                                    [
-                                        element
-                                        for coin, coin_orders in orders.groupby("buy_symbol", sort=False)
-                                        .sum(numeric_only=True)
-                                        .sort_values("cost", ascending=False)
-                                        .tail(-4)
-                                        .iterrows()
-                                        for element in (
-                                            print_trade_text(coin, coin_orders),
-                                            html.Br(),
-                                        )
-                                    ],
+                                    trade_lines(coins.tail(-4)),
                                     id={"type": "card-collapse", "index": i},
                                     className="trades-collapse",
                                     is_open=False,
                                 )
-                                if orders.buy_symbol.nunique() > 4
+                                if len(coins) > 4
                                 else None,
                                 dbc.Button(
                                     children="Show all",
@@ -982,15 +975,26 @@ def create_trades_page(analytics: PortfolioAnalytics):
                                     color="link",
                                     id={"type": "card-toggle", "index": i},
                                 )
-                                if orders.buy_symbol.nunique() > 4
+                                if len(coins) > 4
                                 else None,
                             ]
                         ),
                     ]
                 ),
             )
-            for i, (date, orders) in enumerate(reversed(tuple(order_days.groupby("date"))))
-        ],
+        )
+    return cards
+
+
+def create_trades_page(analytics: PortfolioAnalytics):
+    n_days = len(analytics.snapshot.daily_summary.index.unique(level="day"))
+    n_pages = max(-(-n_days // TRADES_PAGE_SIZE), 1)
+
+    masonry_cards = html.Div(
+        className="row",
+        id="cards",
+        **{"data-masonry": '{"percentPosition": true }'},
+        children=create_trade_cards(analytics, page=1),
     )
 
     return html.Div(
@@ -999,15 +1003,18 @@ def create_trades_page(analytics: PortfolioAnalytics):
                 [
                     dbc.Col(
                         [
-                            dcc.Download(
-                                id="download-dataframe-csv",
-                            ),
                             dbc.DropdownMenu(
                                 label="Export to CSV",
                                 children=[
-                                    dbc.DropdownMenuItem("Everything", id="btn_csv_all", n_clicks=0),
-                                    dbc.DropdownMenuItem("Last 3 Months", id="btn_csv_3", n_clicks=0),
-                                    dbc.DropdownMenuItem("Last Month", id="btn_csv_month", n_clicks=0),
+                                    dbc.DropdownMenuItem(
+                                        "Everything", href="/export/trades.csv", external_link=True
+                                    ),
+                                    dbc.DropdownMenuItem(
+                                        "Last 3 Months", href="/export/trades.csv?days=91", external_link=True
+                                    ),
+                                    dbc.DropdownMenuItem(
+                                        "Last Month", href="/export/trades.csv?days=30", external_link=True
+                                    ),
                                 ],
                                 className="d-block w-100",
                             ),
@@ -1022,6 +1029,20 @@ def create_trades_page(analytics: PortfolioAnalytics):
             ),
             html.Hr(),
             masonry_cards,
+            dbc.Row(
+                dbc.Col(
+                    dbc.Pagination(
+                        id="trades-pagination",
+                        max_value=n_pages,
+                        active_page=1,
+                        fully_expanded=False,
+                        previous_next=True,
+                        first_last=True,
+                    ),
+                    width="auto",
+                ),
+                justify="center",
+            ),
             DeferScript(src="https://cdn.jsdelivr.net/npm/masonry-layout@4.2.2/dist/masonry.pkgd.min.js"),
         ],
         className="pt-2",
@@ -7,7 +7,6 @@ from flask_login import (
     current_user,
     login_required,
 )
-import secrets
 from os import environ as env
 from dotenv import load_dotenv, find_dotenv
 from functools import wraps
@@ -29,8 +28,9 @@ class User(UserMixin):
 
 
 class LoginProvider:
-    def __init__(self, config: DashboardConfig, server: Flask, secrets_store: SecretsStore):
-        self.secret_key = secrets.token_hex(24)
+    def __init__(self, config: DashboardConfig, server: Flask, secrets_store: SecretsStore, secret_key: str):
+        # signs the session cookies, all dashboard worker processes need the same key
+        self.secret_key = secret_key
         self.provider = config.login_provider
         self.secrets_store = secrets_store
 
@@ -0,0 +1,92 @@
+import os
+import pickle
+from pathlib import Path
+from threading import Lock, Thread
+from time import time
+from typing import Dict, Optional, Union
+import logging
+
+import ccxt
+
+from metrics import metrics
+
+"""
+
+On disk cache of the exchanges markets and currencies (symbols, precision and limits)
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class MarketCache:
+    """
+    Keeps the markets of each exchange in a pickle file, which is replaced atomically. At startup the markets are set
+    from the file instead of downloading them, markets older than `ttl` seconds are reloaded in a background thread.
+    Only if there is no cache file yet, the markets are downloaded right away.
+    """
+
+    def __init__(self, directory: Union[str, Path], ttl: float):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._updated: Dict[str, float] = {}
+        self._refreshing: Dict[str, Thread] = {}
+        self._lock = Lock()
+
+    def file(self, name: str) -> Path:
+        return self.directory / f"{name}_markets.pickle"
+
+    def read(self, name: str) -> Optional[dict]:
+        try:
+            with open(self.file(name), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f"Could not load markets from {self.file(name)}: {e}")
+            return None
+
+    def write(self, name: str, cached: dict):
+        temp_file = self.file(name).with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_file, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.file(name))
+
+    def load(self, exchange: ccxt.Exchange, name: str) -> bool:
+        # name identifies the exchange and mode (e.g. binance_test), raises ccxt errors of a synchronous download.
+        # returns whether the markets were loaded from the cache, i.e. without any request to the exchange
+        cached = self.read(name)
+        if cached is None:
+            metrics.inc("exchange_markets_cache_total", exchange=name, result="miss")
+            self.refresh(exchange, name)
+            return False
+        exchange.set_markets(cached["markets"], cached["currencies"])
+        self._updated[name] = cached["time"]
+        metrics.inc("exchange_markets_cache_total", exchange=name, result="hit")
+        self.ensure_fresh(exchange, name)
+        return True
+
+    def refresh(self, exchange: ccxt.Exchange, name: str):
+        exchange.load_markets(reload=True)
+        self._updated[name] = time()
+        self.write(
+            name, {"time": self._updated[name], "markets": exchange.markets, "currencies": exchange.currencies}
+        )
+        logger.info(f"Updated markets of {name}: {len(exchange.markets)} markets")
+
+    def ensure_fresh(self, exchange: ccxt.Exchange, name: str):
+        """reload expired markets in the background, the cached markets are used meanwhile"""
+        if time() - self._updated.get(name, 0) < self.ttl:
+            return
+        with self._lock:
+            if name in self._refreshing and self._refreshing[name].is_alive():
+                return
+            self._refreshing[name] = Thread(target=self._refresh_in_background, args=(exchange, name), daemon=True)
+            self._refreshing[name].start()
+
+    def _refresh_in_background(self, exchange: ccxt.Exchange, name: str):
+        try:
+            self.refresh(exchange, name)
+        except ccxt.BaseError as e:
+            logger.warning(f"Could not update markets of {name}, using the cached markets: {e}")
@@ -1,3 +1,4 @@
+import asyncio
 import time
 import requests.exceptions
 from utils import print_crypto_amount
@@ -53,6 +54,16 @@ def authorized_only(command_handler: Callable[..., Awaitable]) -> Callable[...,
             return wrapper
 
         logger.info("Executing handler: %s for chat_id: %s", command_handler.__name__, chat_id)
+        analytics = self.trading_bot.analytics
+        if not analytics.ready.is_set():
+            # the analytics data is still loaded in the background (lazy startup)
+            await update.message.reply_text("I am still loading your portfolio data, just a moment...")
+            if not await asyncio.get_running_loop().run_in_executor(None, analytics.wait_until_ready):
+                await update.message.reply_text(
+                    f"Sorry, your portfolio data is not available ({analytics.unavailable_reason()}), "
+                    "please try again later!"
+                )
+                return
         try:
             return await command_handler(self, *args, **kwargs)
         except Exception as e:
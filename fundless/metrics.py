@@ -0,0 +1,236 @@
+import itertools
+import json
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter, time
+from typing import Dict, Iterator, Tuple, Sequence, Any
+import logging
+
+from redo import retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last entry counts values above the largest bucket (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class Metrics:
+    """
+    Thread safe, in-process registry for counters, gauges and histograms.
+    Read it with `snapshot()` or export it with `to_prometheus()` / `to_json()`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        key = label_key(labels)
+        with self._lock:
+            for metric_type in (self.counters, self.gauges):
+                if name in metric_type:
+                    return metric_type[name].get(key, 0)
+        return 0
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    @contextmanager
+    def retrying(self, action, provider: str, endpoint: str, attempts: int = 5, **kwargs):
+        """
+        `redo.retrying`, counting the retries of an API call. redo calls `cleanup` after every failed attempt, the
+        last one is re-raised instead of retried and therefore not counted.
+        """
+
+        def retry_action(*args, **action_kwargs):
+            failures = itertools.count(1)
+
+            def count_retry():
+                if next(failures) < attempts:
+                    self.inc("api_retries_total", provider=provider, endpoint=endpoint)
+
+            return retry(action, attempts=attempts, cleanup=count_retry, args=args, kwargs=action_kwargs, **kwargs)
+
+        yield retry_action
+
+    def snapshot(self) -> dict:
+        def series(metric: dict, convert=lambda value: value):
+            return {
+                name: [{"labels": dict(key), "value": convert(value)} for key, value in values.items()]
+                for name, values in metric.items()
+            }
+
+        with self._lock:
+            return {
+                "counters": series(self.counters),
+                "gauges": series(self.gauges),
+                "histograms": series(self.histograms, lambda histogram: histogram.to_dict()),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self) -> str:
+        def format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()):
+            pairs = key + extra
+            if len(pairs) == 0:
+                return ""
+            escaped = [(label, value.replace("\\", "\\\\").replace('"', '\\"')) for label, value in pairs]
+            return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+        lines = []
+        with self._lock:
+            for metric_type, metric in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, values in sorted(metric.items()):
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    for key, value in values.items():
+                        lines.append(f"{name}{format_labels(key)} {value}")
+            for name, values in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in values.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else str(bound)
+                        lines.append(f"{name}_bucket{format_labels(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def error_chain(e: BaseException) -> Iterator[BaseException]:
+    # the error and the errors it was raised from or raised while handling
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        yield e
+        e = e.__cause__ or e.__context__
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """
+    HTTP 429 from requests based clients or the rate limit errors of ccxt. For error responses with a JSON body,
+    pycoingecko raises a ValueError of the body while handling the HTTPError.
+    """
+    for error in error_chain(e):
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+        if status_code == 429 or type(error).__name__ in ("RateLimitExceeded", "DDoSProtection"):
+            return True
+        body = error.args[0] if isinstance(error, ValueError) and len(error.args) > 0 else None
+        if isinstance(body, dict):
+            status = body.get("status") if isinstance(body.get("status"), dict) else body
+            if status.get("error_code") == 429:
+                return True
+    return False
+
+
+class InstrumentedClient:
+    """
+    Transparent proxy around an API client (CoinGecko, ccxt exchange), counting calls, errors and call durations
+    per provider and endpoint. Attribute access and assignment are forwarded to the wrapped client.
+    """
+
+    def __init__(self, client, provider: str, registry: "Metrics" = None):
+        object.__setattr__(self, "_client", client)
+        object.__setattr__(self, "_provider", provider)
+        object.__setattr__(self, "_metrics", registry or metrics)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        provider = self._provider
+        registry = self._metrics
+
+        @wraps(attribute)
+        def instrumented(*args, **kwargs):
+            registry.inc("api_calls_total", provider=provider, endpoint=name)
+            start = perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                registry.inc("api_errors_total", provider=provider, endpoint=name)
+                if is_rate_limit_error(e):
+                    registry.inc("api_rate_limited_total", provider=provider, endpoint=name)
+                raise
+            finally:
+                duration = perf_counter() - start
+                registry.observe("api_call_duration_seconds", duration, provider=provider, endpoint=name)
+
+        return instrumented
+
+    def __setattr__(self, name: str, value):
+        setattr(self._client, name, value)
+
+    def __repr__(self):
+        return f"InstrumentedClient({self._client!r})"
+
+
+def record_success(stage: str, duration: float, registry: "Metrics" = None):
+    registry = registry or metrics
+    registry.observe("analytics_stage_duration_seconds", duration, stage=stage)
+    registry.inc("analytics_stage_success_total", stage=stage)
+    registry.set("analytics_stage_last_success_timestamp_seconds", time(), stage=stage)
+
+
+def record_failure(stage: str, duration: float, registry: "Metrics" = None):
+    registry = registry or metrics
+    registry.observe("analytics_stage_duration_seconds", duration, stage=stage)
+    registry.inc("analytics_stage_failure_total", stage=stage)
+
+
+# process wide registry
+metrics = Metrics()
@@ -0,0 +1,144 @@
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Set
+import logging
+
+import ccxt
+import pandas as pd
+
+from config import ExchangeEnum
+from metrics import metrics
+
+"""
+
+Recovery of orders, that have been placed (order_ids.csv) but are missing in the trades file, e.g. after downtime
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def order_record(order: dict, exchange: ExchangeEnum) -> dict:
+    # keyword arguments of PortfolioAnalytics.add_trade for a closed ccxt order
+    fee = order.get("fee") or {}
+    return dict(
+        date=pd.Timestamp(order["timestamp"], unit="ms", tz="UTC"),
+        id=str(order["id"]),
+        buy_symbol=order["symbol"].split("/")[0],
+        sell_symbol=order["symbol"].split("/")[1],
+        price=order["price"],
+        amount=order["amount"],
+        cost=order["cost"],
+        fee=fee.get("cost") or 0.0,
+        fee_symbol=fee.get("currency") or "",
+        exchange=exchange,
+    )
+
+
+class OrderRecovery:
+    """
+    Fetches missing orders in a background thread, so the analytics updates are not blocked. Orders are fetched in
+    bulk per symbol with `fetch_closed_orders`, only orders not found that way are fetched one by one. The
+    recovered orders are collected with `take()` and ingested as one batch. Orders the exchange reports as not
+    found or invalid are not fetched again.
+    """
+
+    def __init__(self, exchange: Callable[[], ccxt.Exchange], exchange_name: Callable[[], ExchangeEnum]):
+        self.exchange = exchange
+        self.exchange_name = exchange_name
+        self._recovered: List[dict] = []
+        self._given_up: Set[str] = set()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, missing_orders: pd.DataFrame):
+        # missing_orders: id, symbol and date of the orders, does nothing while a recovery is running
+        with self._lock:
+            if self.running:
+                return
+            missing_orders = missing_orders.loc[~missing_orders["id"].astype(str).isin(self._given_up)]
+            if len(missing_orders) == 0:
+                return
+            self._thread = Thread(target=self.recover, args=(missing_orders.copy(),), daemon=True)
+            self._thread.start()
+
+    def take(self) -> List[dict]:
+        with self._lock:
+            recovered, self._recovered = self._recovered, []
+        return recovered
+
+    def recover(self, missing_orders: pd.DataFrame):
+        start = perf_counter()
+        exchange = self.exchange()
+        exchange_name = self.exchange_name()
+        records = []
+        for symbol, orders in missing_orders.groupby("symbol"):
+            ids = set(orders["id"].astype(str))
+            found = {}
+            if exchange.has.get("fetchClosedOrders"):
+                try:
+                    found = self.fetch_closed_orders(exchange, symbol, ids, since=orders["date"].min())
+                except ccxt.BaseError as e:
+                    logger.warning(f"Could not fetch closed {symbol} orders from {exchange.name}: {e}")
+            for id in ids - found.keys():
+                try:
+                    order = self.fetch_order(exchange, id, symbol)
+                except ccxt.InvalidOrder as e:
+                    # includes OrderNotFound, fetching the order again would fail the same way
+                    logger.error(f"Could not fetch order {id} from {exchange.name}, giving up: {e}")
+                    with self._lock:
+                        self._given_up.add(id)
+                    continue
+                except ccxt.BaseError as e:
+                    logger.warning(f"Could not fetch order {id} from {exchange.name}, retrying later: {e}")
+                    continue
+                if order["status"] == "open":
+                    logger.info(f"Order {id} is not yet closed!")
+                else:
+                    found[id] = order
+            records += [order_record(order, exchange_name) for order in found.values()]
+            logger.info(f"Recovered {len(found)} of {len(ids)} missing {symbol} orders")
+        with self._lock:
+            self._recovered += records
+        metrics.inc("orders_recovered_total", len(records))
+        metrics.observe("order_recovery_duration_seconds", perf_counter() - start)
+
+    @staticmethod
+    def fetch_closed_orders(exchange: ccxt.Exchange, symbol: str, ids: Set[str], since: pd.Timestamp) -> Dict:
+        # page through the closed orders of the symbol, until all ids are found or there are no newer orders
+        since_ms = int((since - pd.Timedelta(days=1)).timestamp() * 1000)
+        found = {}
+        with metrics.retrying(
+            exchange.fetch_closed_orders,
+            provider=exchange.id,
+            endpoint="fetch_closed_orders",
+            sleeptime=1,
+            sleepscale=2,
+            jitter=0,
+            retry_exceptions=(ccxt.NetworkError,),
+        ) as fetch_closed_orders:
+            while not ids <= found.keys():
+                orders = fetch_closed_orders(symbol, since=since_ms)
+                found.update({str(order["id"]): order for order in orders if str(order["id"]) in ids})
+                last = max((order["timestamp"] or 0 for order in orders), default=0)
+                if last < since_ms:
+                    break
+                since_ms = last + 1
+        return found
+
+    @staticmethod
+    def fetch_order(exchange: ccxt.Exchange, id: str, symbol: str) -> dict:
+        with metrics.retrying(
+            exchange.fetch_order,
+            provider=exchange.id,
+            endpoint="fetch_order",
+            sleeptime=1,
+            sleepscale=2,
+            jitter=0,
+            retry_exceptions=(ccxt.NetworkError,),
+        ) as fetch_order:
+            return fetch_order(id, symbol)
@@ -0,0 +1,110 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List
+import logging
+
+import ccxt
+import numpy as np
+import pandas as pd
+
+from metrics import metrics
+
+"""
+
+Pricing sources for asset balances, all prices are denoted in the accounting (base) currency
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class PricingSource(ABC):
+    name: str
+
+    @abstractmethod
+    def prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """prices of those symbols, that this source is able to price"""
+
+
+class ExchangeTickerPricing(PricingSource):
+    """
+    Last traded prices from a single bulk ticker request to the exchange, i.e. the prices orders are filled at.
+    Only assets traded against `market_quote()` (the base symbol) are priced, `quote_rate` converts the market
+    quote into the accounting currency.
+    """
+
+    name = "exchange"
+
+    def __init__(
+        self,
+        exchange: Callable[[], ccxt.Exchange],
+        market_quote: Callable[[], str],
+        quote_rate: Callable[[], float],
+    ):
+        self.exchange = exchange
+        self.market_quote = market_quote
+        self.quote_rate = quote_rate
+
+    def prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        exchange = self.exchange()
+        market_quote = self.market_quote().upper()
+        symbols = {symbol.upper() for symbol in symbols}
+        prices = {}
+        if market_quote in symbols:
+            prices[market_quote] = 1.0
+        pairs = [f"{symbol}/{market_quote}" for symbol in symbols]
+        pairs = [pair for pair in pairs if pair in exchange.symbols]
+        if len(pairs) > 0 and exchange.has.get("fetchTickers"):
+            try:
+                tickers = exchange.fetch_tickers(pairs)
+            except ccxt.BaseError as e:
+                logger.warning(f"Could not fetch tickers from {exchange.name}: {e}")
+                tickers = {}
+            for pair, ticker in tickers.items():
+                if pair in pairs and ticker.get("last") is not None:
+                    prices[pair.split("/")[0]] = float(ticker["last"])
+        if len(prices) == 0:
+            return prices
+        rate = self.quote_rate()
+        return {symbol: price * rate for symbol, price in prices.items()}
+
+
+class CoinGeckoPricing(PricingSource):
+    """Prices from the CoinGecko market data (or a bulk price request) of the analytics module"""
+
+    name = "coingecko"
+
+    def __init__(self, analytics, accounting_currency: Callable[[], str]):
+        self.analytics = analytics
+        self.accounting_currency = accounting_currency
+
+    def prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        # coins without market data have a NaN rate
+        rates = self.analytics.conversion_rates(list(symbols), self.accounting_currency())
+        return {symbol: rate for symbol, rate in rates.items() if not np.isnan(rate)}
+
+
+class PricingChain:
+    """Asks the pricing sources in order, each source only prices the symbols left over by the previous ones"""
+
+    def __init__(self, sources: List[PricingSource]):
+        self.sources = sources
+
+    def prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        missing = {symbol.upper() for symbol in symbols}
+        prices = {}
+        for source in self.sources:
+            if len(missing) == 0:
+                break
+            found = {symbol: price for symbol, price in source.prices(missing).items() if symbol in missing}
+            metrics.inc("prices_resolved_total", len(found), source=source.name)
+            prices.update(found)
+            missing -= found.keys()
+        if len(missing) > 0:
+            logger.warning(f"No price found for {', '.join(sorted(missing))}")
+        return prices
+
+    def values(self, amounts: np.ndarray, symbols: np.ndarray) -> np.ndarray:
+        # value of the amounts in accounting currency, 0 for assets without price
+        symbols = pd.Series(np.asarray(symbols, dtype=str)).str.upper()
+        prices = symbols.map(self.prices(symbols.unique())).to_numpy(dtype=float)
+        return np.nan_to_num(np.asarray(amounts, dtype=float) * prices)
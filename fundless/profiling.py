@@ -0,0 +1,98 @@
+import cProfile
+import heapq
+import json
+import os
+import pstats
+from functools import wraps
+from itertools import count
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, strftime
+from typing import Callable, List, Tuple, Union
+import logging
+
+import plotly.utils
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+PANDAS_PATH = f"{os.sep}pandas{os.sep}"
+
+
+def payload_size(layout) -> int:
+    """Size of the JSON payload in bytes, that dash sends to the browser for the given callback output"""
+    try:
+        return len(json.dumps(layout, cls=plotly.utils.PlotlyJSONEncoder).encode("utf-8"))
+    except TypeError:
+        logger.debug("Callback output is not JSON serializable")
+        return 0
+
+
+def pandas_time(profile: cProfile.Profile) -> float:
+    # time spent within functions of the pandas package (excluding functions called from pandas)
+    stats = pstats.Stats(profile).stats
+    return sum(
+        total_time for (filename, _, _), (_, _, total_time, _, _) in stats.items() if PANDAS_PATH in filename
+    )
+
+
+class CallbackProfiler:
+    """
+    Opt-in profiling layer for dash callbacks.
+
+    Records wall time, time spent in pandas and payload size of every callback invocation as metrics and keeps the
+    cProfile snapshots of the slowest `top_n` invocations on disk (open them with `python -m pstats` or snakeviz).
+    """
+
+    def __init__(self, enabled: bool = False, directory: Union[str, Path] = "profiles", top_n: int = 10):
+        self.enabled = enabled
+        self.directory = Path(directory)
+        self.top_n = top_n
+        self._slowest: List[Tuple[float, int, Path]] = []  # min heap of (wall time, tie breaker, snapshot file)
+        self._counter = count()
+        self._lock = Lock()
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Profiling dash callbacks, snapshots of the {top_n} slowest calls go to {self.directory}")
+
+    def wrap(self, callback: Callable) -> Callable:
+        if not self.enabled:
+            return callback
+        name = callback.__name__
+
+        @wraps(callback)
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            start = perf_counter()
+            profile.enable()
+            try:
+                result = callback(*args, **kwargs)
+            finally:
+                profile.disable()
+                wall_time = perf_counter() - start
+                metrics.observe("dash_callback_wall_seconds", wall_time, callback=name)
+                metrics.observe("dash_callback_pandas_seconds", pandas_time(profile), callback=name)
+                self.keep_if_slowest(name, wall_time, profile)
+            metrics.observe(
+                "dash_callback_payload_bytes", payload_size(result), buckets=PAYLOAD_BUCKETS, callback=name
+            )
+            return result
+
+        return profiled
+
+    def keep_if_slowest(self, name: str, wall_time: float, profile: cProfile.Profile):
+        with self._lock:
+            if len(self._slowest) >= self.top_n and wall_time <= self._slowest[0][0]:
+                return
+            file = self.directory / f"{strftime('%Y%m%d-%H%M%S')}-{name}-{wall_time * 1000:.0f}ms.prof"
+            profile.dump_stats(file)
+            heapq.heappush(self._slowest, (wall_time, next(self._counter), file))
+            if len(self._slowest) > self.top_n:
+                _, _, evicted = heapq.heappop(self._slowest)
+                evicted.unlink(missing_ok=True)
+
+    def slowest(self) -> List[Tuple[float, Path]]:
+        with self._lock:
+            return [(wall_time, file) for wall_time, _, file in sorted(self._slowest, reverse=True)]
@@ -0,0 +1,160 @@
+import heapq
+import itertools
+from functools import wraps
+from threading import Condition, Lock
+from time import monotonic
+from typing import Dict, Optional
+import logging
+
+from metrics import metrics, error_chain, is_rate_limit_error
+
+"""
+
+Proactive rate limiting of API calls, shared by all callers within the process
+
+"""
+
+logger = logging.getLogger(__name__)
+
+# request priorities, lower values are served first
+INTERACTIVE = 0  # lookups a user or an order is waiting for
+DEFAULT = 1  # regular data updates
+BACKGROUND = 2  # history backfill
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DEFAULT: "default", BACKGROUND: "background"}
+
+
+class RateLimiter:
+    """
+    Token bucket with a priority queue of waiting requests. Requests are served by priority and in arrival order
+    within a priority, each request takes one token. Tokens are refilled with `rate` tokens per second up to
+    `burst` tokens.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int = 1, throttle_pause: float = 30):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.throttle_pause = throttle_pause  # pause after a rate limit error without Retry-After header
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._queue = []
+        self._arrivals = itertools.count()
+        self._condition = Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = DEFAULT):
+        start = monotonic()
+        request = (priority, next(self._arrivals))
+        with self._condition:
+            heapq.heappush(self._queue, request)
+            metrics.set("rate_limiter_queue_length", len(self._queue), limiter=self.name)
+            try:
+                while True:
+                    now = monotonic()
+                    self._refill(now)
+                    if self._queue[0] != request:
+                        # wait until the requests ahead have been served
+                        self._condition.wait()
+                    elif now < self._paused_until:
+                        self._condition.wait(self._paused_until - now)
+                    elif self._tokens < 1:
+                        self._condition.wait((1 - self._tokens) / self.rate)
+                    else:
+                        self._tokens -= 1
+                        break
+            finally:
+                self._queue.remove(request)
+                heapq.heapify(self._queue)
+                metrics.set("rate_limiter_queue_length", len(self._queue), limiter=self.name)
+                self._condition.notify_all()
+        metrics.observe(
+            "rate_limiter_wait_seconds",
+            monotonic() - start,
+            limiter=self.name,
+            priority=PRIORITY_NAMES.get(priority, priority),
+        )
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """pause all requests, after the API responded with a rate limit error anyway"""
+        pause = retry_after if retry_after is not None else self.throttle_pause
+        logger.warning(f"Rate limit of {self.name} reached, pausing requests for {pause:g} seconds")
+        metrics.inc("rate_limiter_throttled_total", limiter=self.name)
+        with self._condition:
+            self._tokens = 0
+            self._paused_until = max(self._paused_until, monotonic() + pause)
+            self._condition.notify_all()
+
+
+limiters: Dict[str, RateLimiter] = {}
+limiters_lock = Lock()
+
+
+def get_limiter(name: str, rate: float, burst: int = 1) -> RateLimiter:
+    # one limiter per API and process, the first caller defines its rate
+    with limiters_lock:
+        if name not in limiters:
+            limiters[name] = RateLimiter(name, rate, burst)
+        return limiters[name]
+
+
+def response_error(e: Exception) -> Optional[Exception]:
+    # the error with the HTTP response, e.g. the HTTPError behind a ValueError of pycoingecko
+    return next((error for error in error_chain(e) if getattr(error, "response", None) is not None), None)
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(response_error(e), "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedClient:
+    """
+    Transparent proxy around an API client, every method call waits for a token of the rate limiter first.
+    `with_priority()` returns a proxy of the same client and limiter with another request priority.
+    """
+
+    def __init__(self, client, limiter: RateLimiter, priority: int = DEFAULT):
+        object.__setattr__(self, "_client", client)
+        object.__setattr__(self, "_limiter", limiter)
+        object.__setattr__(self, "_priority", priority)
+
+    def with_priority(self, priority: int) -> "RateLimitedClient":
+        return RateLimitedClient(self._client, self._limiter, priority)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        limiter = self._limiter
+        priority = self._priority
+
+        @wraps(attribute)
+        def rate_limited(*args, **kwargs):
+            limiter.acquire(priority)
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                limiter.throttled(retry_after(e))
+                # raise the HTTPError, so that callers retrying on HTTP errors retry the rate limited request
+                error = response_error(e)
+                if error is None or error is e:
+                    raise
+                raise error from e
+
+        return rate_limited
+
+    def __setattr__(self, name: str, value):
+        setattr(self._client, name, value)
+
+    def __repr__(self):
+        return f"RateLimitedClient({self._client!r}, priority={PRIORITY_NAMES.get(self._priority)})"
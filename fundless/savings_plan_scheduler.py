@@ -30,6 +30,13 @@ class SavingsPlanScheduler:
                     logger.info(f"No savings plan execution today ({date.today().strftime('%d.%m.%y')})")
                     return
             logger.info(f"Executing savings plan now ({date.today().strftime('%d.%m.%y')})...")
+            analytics = self.message_bot.trading_bot.analytics
+            if not analytics.wait_until_ready():
+                reason = analytics.unavailable_reason()
+                logger.error(f"Skipping savings plan execution, the portfolio data is not available: {reason}")
+                with asyncio.Runner() as runner:
+                    runner.run(self.message_bot.send(f"Skipping the savings plan, no portfolio data: {reason}"))
+                return
             if self.config.trading_bot_config.savings_plan_automatic_execution:
                 with asyncio.Runner() as runner:
                     runner.run(self.message_bot.send("Executing savings plan!"))
@@ -0,0 +1,46 @@
+import os
+import pickle
+from pathlib import Path
+from typing import Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStore:
+    """
+    Shares the latest analytics state between the bot process (writer) and the dashboard worker processes
+    (readers).
+
+    The state is pickled to a file on local disk, which is replaced atomically, so readers never load a partially
+    written file. Readers only unpickle the file again after it has been replaced.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.file = self.directory / "analytics_state.pickle"
+        self._loaded_mtime: Optional[int] = None
+        self._state: Optional[dict] = None
+
+    def write(self, state: dict):
+        temp_file = self.file.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_file, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.file)
+
+    def read(self) -> Optional[dict]:
+        # returns the same object as long as the file has not been replaced
+        try:
+            mtime = self.file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._loaded_mtime:
+            try:
+                with open(self.file, "rb") as f:
+                    self._state = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                logger.warning(f"Could not load analytics state from {self.file}: {e}")
+                return self._state
+            self._loaded_mtime = mtime
+        return self._state
@@ -0,0 +1,218 @@
+import sys
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+import pandas as pd
+
+"""
+
+Compact in-memory storage of the trades
+
+"""
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_COLUMNS = ("buy_symbol", "sell_symbol", "fee_symbol", "exchange")
+MISSING_TIME = np.iinfo(np.int64).min  # NaT
+
+
+class Trade:
+    """A single trade, `base_cost` is the cost denoted in the base currency"""
+
+    __slots__ = (
+        "date",
+        "id",
+        "buy_symbol",
+        "sell_symbol",
+        "price",
+        "amount",
+        "cost",
+        "fee",
+        "fee_symbol",
+        "cost_total",
+        "base_cost",
+        "exchange",
+    )
+
+    def __init__(
+        self,
+        date: pd.Timestamp,
+        id: str,
+        buy_symbol: str,
+        sell_symbol: str,
+        price: float,
+        amount: float,
+        cost: float,
+        fee: float = 0.0,
+        fee_symbol: str = "",
+        cost_total: Optional[float] = None,
+        base_cost: Optional[float] = None,
+        exchange: Optional[str] = None,
+    ):
+        self.date = date
+        self.id = id
+        self.buy_symbol = buy_symbol
+        self.sell_symbol = sell_symbol
+        self.price = price
+        self.amount = amount
+        self.cost = cost
+        self.fee = fee
+        self.fee_symbol = fee_symbol
+        self.cost_total = cost + fee if cost_total is None else cost_total
+        self.base_cost = base_cost
+        self.exchange = exchange
+
+    def as_record(self, base_cost_row: str) -> dict:
+        record = {name: getattr(self, name) for name in self.__slots__ if name != "base_cost"}
+        record[base_cost_row] = self.base_cost
+        return record
+
+    def __repr__(self):
+        return f"Trade({self.date}, {self.id}, {self.amount} {self.buy_symbol} for {self.cost} {self.sell_symbol})"
+
+
+def column_kind(column: str, dtype=None) -> str:
+    if column == "date":
+        return "time"
+    if column in CATEGORY_COLUMNS:
+        return "category"
+    if column == "id" or (dtype is not None and not pd.api.types.is_numeric_dtype(dtype)):
+        return "object"
+    return "float"
+
+
+class TradeLog:
+    """
+    Columnar log of all trades. Timestamps are stored as int64 nanoseconds since epoch (UTC), symbols as int32
+    codes into a dictionary of categories and all amounts as float64. The arrays grow by doubling their capacity,
+    so appending a trade is amortized O(1). `to_frame()` materializes a new DataFrame (with categorical symbol
+    columns) of all trades on every call, callers that only need a column should use `column()` instead.
+    """
+
+    dtypes = {"time": np.int64, "category": np.int32, "object": object, "float": np.float64}
+    missing = {"time": MISSING_TIME, "category": -1, "object": None, "float": np.nan}
+
+    def __init__(self, columns: Iterable[str], kinds: Dict[str, str] = None, capacity: int = 64):
+        self.columns: List[str] = list(columns)
+        self.kinds = {column: (kinds or {}).get(column, column_kind(column)) for column in self.columns}
+        self._capacity = max(capacity, 1)
+        self._size = 0
+        self._arrays = {
+            column: np.full(self._capacity, self.missing[kind], dtype=self.dtypes[kind])
+            for column, kind in self.kinds.items()
+        }
+        self._categories: Dict[str, List[str]] = {
+            column: [] for column, kind in self.kinds.items() if kind == "category"
+        }
+        self._codes: Dict[str, Dict[str, int]] = {column: {} for column in self._categories}
+        self._last_time = MISSING_TIME  # latest trade time, so appends don't need to scan the dates
+        self._lock = Lock()
+
+    @classmethod
+    def from_frame(cls, trades_df: pd.DataFrame) -> "TradeLog":
+        kinds = {column: column_kind(column, trades_df[column].dtype) for column in trades_df.columns}
+        self = cls(trades_df.columns, kinds, capacity=max(2 * len(trades_df), 64))
+        n = len(trades_df)
+        for column, kind in self.kinds.items():
+            values = trades_df[column]
+            if kind == "time":
+                self._arrays[column][:n] = pd.DatetimeIndex(pd.to_datetime(values, utc=True)).asi8
+            elif kind == "category":
+                codes, categories = pd.factorize(values)
+                self._categories[column] = [str(category) for category in categories]
+                self._codes[column] = {category: code for code, category in enumerate(self._categories[column])}
+                self._arrays[column][:n] = codes
+            elif kind == "float":
+                self._arrays[column][:n] = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+            else:
+                self._arrays[column][:n] = values.to_numpy(dtype=object)
+        self._size = n
+        if "date" in self.kinds and n > 0:
+            self._last_time = int(self._arrays["date"][:n].max())
+        return self
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        self._capacity *= 2
+        for column, array in self._arrays.items():
+            kind = self.kinds[column]
+            grown = np.full(self._capacity, self.missing[kind], dtype=self.dtypes[kind])
+            grown[: self._size] = array[: self._size]
+            self._arrays[column] = grown
+
+    def _code(self, column: str, value) -> int:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return -1
+        value = str(value)
+        code = self._codes[column].get(value)
+        if code is None:
+            code = len(self._categories[column])
+            self._categories[column].append(value)
+            self._codes[column][value] = code
+        return code
+
+    def append(self, trade: Trade, base_cost_row: str):
+        with self._lock:
+            if self._size == self._capacity:
+                self._grow()
+            i = self._size
+            for column, kind in self.kinds.items():
+                value = getattr(trade, "base_cost" if column == base_cost_row else column, None)
+                if kind == "time":
+                    self._arrays[column][i] = MISSING_TIME if value is None else pd.Timestamp(value).value
+                    if column == "date":
+                        self._last_time = max(self._last_time, self._arrays[column][i])
+                elif kind == "category":
+                    self._arrays[column][i] = self._code(column, value)
+                elif kind == "float":
+                    self._arrays[column][i] = np.nan if value is None else value
+                else:
+                    self._arrays[column][i] = value
+            self._size += 1
+
+    @property
+    def last_date(self) -> Optional[pd.Timestamp]:
+        # date of the latest trade, None if there is none
+        return None if self._last_time == MISSING_TIME else pd.Timestamp(self._last_time, tz="UTC")
+
+    def sort_by_date(self):
+        # stable, so that trades of the same time keep their order
+        with self._lock:
+            times = self._arrays["date"][: self._size]
+            if np.all(times[:-1] <= times[1:]):
+                return
+            order = np.argsort(times, kind="stable")
+            for array in self._arrays.values():
+                array[: self._size] = array[: self._size][order]
+
+    def _values(self, column: str):
+        values = self._arrays[column][: self._size]
+        kind = self.kinds[column]
+        if kind == "time":
+            return pd.DatetimeIndex(values.view("datetime64[ns]")).tz_localize("UTC")
+        if kind == "category":
+            # code -1 is missing
+            return pd.Categorical.from_codes(values, categories=self._categories[column])
+        return values.copy()
+
+    def column(self, column: str) -> pd.Series:
+        with self._lock:
+            return pd.Series(self._values(column), name=column)
+
+    def to_frame(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.DataFrame({column: self._values(column) for column in self.columns}, columns=self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        # memory of the used part of the arrays and the category dictionaries
+        size = sum(array[: self._size].nbytes for array in self._arrays.values())
+        size += sum(sys.getsizeof(category) for categories in self._categories.values() for category in categories)
+        for column, kind in self.kinds.items():
+            if kind == "object":
+                size += sum(sys.getsizeof(value) for value in self._arrays[column][: self._size])
+        return size
@@ -2,7 +2,6 @@ import ccxt
 import numpy as np
 from typing import List, Tuple, Union
 from datetime import datetime
-from redo import retrying
 
 from config import Config, SecretsStore, ExchangeEnum, OrderTypeEnum
 from analytics import PortfolioAnalytics
@@ -10,6 +9,8 @@ from utils import print_crypto_amount
 import logging
 from constants import FIAT_SYMBOLS
 from exchanges import Exchanges
+from metrics import metrics
+from pricing import PricingChain, ExchangeTickerPricing, CoinGeckoPricing
 
 
 logger = logging.getLogger(__name__)
@@ -33,6 +34,19 @@ class TradingBot:
         self.secrets = bot_config.secrets
         self.analytics = analytics
         self.exchanges = exchanges
+        # exchange prices first, CoinGecko for assets without a market against the base symbol on the exchange
+        self.pricing = PricingChain(
+            [
+                ExchangeTickerPricing(
+                    exchange=lambda: self.exchanges.active,
+                    market_quote=lambda: self.bot_config.trading_bot_config.base_symbol,
+                    quote_rate=lambda: self.analytics.base_symbol_to_base_currency(1.0),
+                ),
+                CoinGeckoPricing(
+                    self.analytics, accounting_currency=lambda: self.bot_config.trading_bot_config.base_currency
+                ),
+            ]
+        )
 
         not_available = [
             symbol.upper()
@@ -46,47 +60,17 @@ class TradingBot:
             logger.warning(not_available)
 
     def balance(self) -> Tuple:
-        # TODO fix for different base symbol and base currency and use analytics module
         try:
             data = self.exchanges.active.fetch_total_balance(
                 {"limit": 250} if self.bot_config.trading_bot_config.exchange == ExchangeEnum.coinbase else None
             )
-
-            # if self.exchanges.active.has['fetchTickers']:
-            #     markets = self.exchanges.active.fetch_tickers()
-            # else:
-            #     markets = None
-            #     # # TODO pull market data in an alternative way
-            #     # raise NotImplementedError("Exchange does not support fetching tickers!")
         except Exception as e:
             logger.error(f"Error while getting balance from exchange:")
             logger.error(e)
             raise e
         symbols = np.fromiter([key for key in data.keys() if data[key] > 0.0], dtype="U10")
         amounts = np.fromiter([data.get(symbol, 0.0) for symbol in symbols], dtype=float)
-        # base = self.bot_config.trading_bot_config.base_symbol.upper()
-        # if markets is not None:
-        #     # use exchange market data
-        #     try:
-        #         values = np.array([float(
-        #             markets[f'{key.upper()}/{base}']['last']) * amount if key.upper() not in FIAT_SYMBOLS
-        #                                                                   and key.upper != base else
-        #                            self.analytics.convert(amount, key, base)
-        #                            for key, amount in zip(symbols, amounts)])
-        #     except KeyError as e:
-        #         print(
-        #             f"Error: The symbol {e.args[0]} is not in the {self.bot_config.trading_bot_config.exchange.value} market data!")
-        #         raise
-        # else:
-        #     # use coingecko market data from analytics module
-        #     values = np.array([float(
-        #         self.analytics.markets.loc[self.analytics.markets['symbol'] == symbol, ['current_price']].values[0][0]
-        #     ) for symbol in symbols])
-        base_currency = self.bot_config.trading_bot_config.base_currency
-        values = np.asarray(
-            [self.analytics.convert(amount, symbol, base_currency) for amount, symbol in zip(amounts, symbols)]
-        )
-        # TODO: Take exchange prices if possible
+        values = self.pricing.values(amounts, symbols)
 
         allocations = values / values.sum() * 100
         sorted = values.argsort()
@@ -166,8 +150,6 @@ class TradingBot:
         return symbols, weights, []
 
     def check_order_executable(self, symbols: np.ndarray, weights: np.ndarray, base_symbol_volume: float):
-        # Pull latest market data
-        self.exchanges.active.fetch_markets()
         # Check for any complications
         problems = {
             "symbols": {},
@@ -176,6 +158,14 @@ class TradingBot:
             "description": "",
             "skip_coins": [],
         }
+        exchange_error = self.exchanges.active_error()
+        if exchange_error is not None:
+            exchange_name = self.bot_config.trading_bot_config.exchange.values[1]
+            logger.error(f"Exchange {exchange_name} is not available: {exchange_error}")
+            problems["occurred"] = True
+            problems["fail"] = True
+            problems["description"] = f"Exchange {exchange_name} is not available: {exchange_error}"
+            return problems
         for symbol, weight in zip(symbols, weights):
             if symbol.lower() == self.bot_config.trading_bot_config.base_symbol.lower():
                 continue
@@ -328,7 +318,7 @@ class TradingBot:
         )  # order volume denoted in base currency
         volume = self.analytics.base_currency_to_base_symbol(volume)
         print_order_allocation(symbols, weights)
-        self.exchanges.active.load_markets()
+        self.exchanges.refresh_markets()
         report = {
             "problems": self.check_order_executable(symbols, weights, volume),
             "order_ids": [],
@@ -360,19 +350,24 @@ class TradingBot:
             amount = weight * volume / price
             cost = weight * volume
             try:
-                if order_type == OrderTypeEnum.limit:
-                    order = self.exchanges.active.create_limit_buy_order(ticker, amount, price=limit_price)
-                elif order_type == OrderTypeEnum.market:
-                    if self.bot_config.trading_bot_config.exchange == ExchangeEnum.coinbase:
-                        # Coinbase requires to give the cost to the amount parameter
-                        # (amount of quote currency instead of amount of currency to buy)
-                        # Coinbase only accepts two decimal points precision for the amount parameter
-                        cost = round(cost, 2)
-                        order = self.exchanges.active.create_market_buy_order(ticker, amount=cost)
+                with metrics.timer(
+                    "order_placement_duration_seconds",
+                    exchange=self.bot_config.trading_bot_config.exchange.value,
+                    order_type=order_type.value,
+                ):
+                    if order_type == OrderTypeEnum.limit:
+                        order = self.exchanges.active.create_limit_buy_order(ticker, amount, price=limit_price)
+                    elif order_type == OrderTypeEnum.market:
+                        if self.bot_config.trading_bot_config.exchange == ExchangeEnum.coinbase:
+                            # Coinbase requires to give the cost to the amount parameter
+                            # (amount of quote currency instead of amount of currency to buy)
+                            # Coinbase only accepts two decimal points precision for the amount parameter
+                            cost = round(cost, 2)
+                            order = self.exchanges.active.create_market_buy_order(ticker, amount=cost)
+                        else:
+                            order = self.exchanges.active.create_market_buy_order(ticker, amount)
                     else:
-                        order = self.exchanges.active.create_market_buy_order(ticker, amount)
-                else:
-                    raise ValueError(f"Invalid order type: {order_type}")
+                        raise ValueError(f"Invalid order type: {order_type}")
             except ccxt.InvalidOrder as e:
                 logger.error(f"Buy order for {amount} {ticker} is invalid!")
                 logger.error(e)
@@ -479,6 +474,7 @@ class TradingBot:
         closed_orders = []
         open_orders = []
         order_report = {symbol: {} for symbol in symbols}
+        trades = []
         for id, symbol in zip(order_ids, symbols):
             if id < 0 if isinstance(id, float) else False:
                 # this is a 'fake' order, when buying coin equals the base symbol we are using to buy the index
@@ -494,8 +490,10 @@ class TradingBot:
                 fee_symbol = ""
             else:
                 logger.info(f"Getting status of {symbol} order...")
-                with retrying(
+                with metrics.retrying(
                     self.exchanges.active.fetch_order,
+                    provider=self.exchanges.active.id,
+                    endpoint="fetch_order",
                     sleeptime=30,
                     sleepscale=1,
                     jitter=0,
@@ -536,9 +534,8 @@ class TradingBot:
             order_report[symbol]["price"] = price
             order_report[symbol]["cost"] = cost
             closed_orders.append(symbol)
-            logger.info(f"Adding {symbol} order to the trades file")
-            try:
-                self.analytics.add_trade(
+            trades.append(
+                dict(
                     date=date,
                     id=str(id),
                     buy_symbol=buy_symbol,
@@ -550,10 +547,23 @@ class TradingBot:
                     fee_symbol=fee_symbol,
                     exchange=self.bot_config.trading_bot_config.exchange,
                 )
-            except Exception as e:
-                logger.error(f"Error while logging trade to trades.csv:")
-                logger.error(e)
-                raise e
+            )
+        logger.info(f"Adding {len(trades)} closed orders to the trades file")
+        try:
+            try:
+                self.analytics.add_trades(trades, strict=True)
+            except ValueError:
+                # add the valid orders one by one, invalid ones are not reported as closed
+                for symbol, trade in zip(list(closed_orders), trades):
+                    try:
+                        self.analytics.add_trades([trade], strict=True)
+                    except ValueError as e:
+                        logger.error(f"Could not add {symbol} order to the trades file: {e}")
+                        closed_orders.remove(symbol)
+        except Exception as e:
+            logger.error(f"Error while logging trades to trades.csv:")
+            logger.error(e)
+            raise e
         order_report["closed"] = closed_orders
         order_report["open"] = open_orders
         return order_report
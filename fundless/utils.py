@@ -2,9 +2,8 @@ from pathlib import Path
 import yaml
 import math
 import ast
-from dash import dcc
-from dash import html
-import dash_bootstrap_components as dbc
+from contextlib import contextmanager
+from time import perf_counter
 from xml.etree import ElementTree
 import logging
 
@@ -53,6 +52,11 @@ def parse_secrets(file_path):
 
 
 def convert_html_to_dash(html_code):
+    # dash is only imported when needed, utils is also used by the bots which do not need it
+    from dash import dcc
+    from dash import html
+    import dash_bootstrap_components as dbc
+
     dash_modules = [dcc, html, dbc]
     """Convert standard html (as string) to Dash components.
 
@@ -93,3 +97,25 @@ def convert_html_to_dash(html_code):
     et = ElementTree.fromstring(html_code)
 
     return _convert(et)
+
+
+class StartupTimer:
+    """Measures the duration of the startup stages and logs a report"""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, perf_counter() - start))
+
+    def report(self):
+        logger.info(" ------ Startup Timing: ------ ")
+        for name, duration in self.stages:
+            logger.info(f"\t- {name + ':': <16}{duration:7.3f} s")
+        logger.info(f"\t- {'total:': <16}{perf_counter() - self.start:7.3f} s")
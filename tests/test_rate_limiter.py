@@ -0,0 +1,42 @@
+import json
+from time import monotonic
+from unittest import mock
+
+import pytest
+import requests
+from pycoingecko import CoinGeckoAPI
+
+from metrics import Metrics, InstrumentedClient, is_rate_limit_error
+from rate_limiter import RateLimiter, RateLimitedClient
+
+
+def rate_limit_response(body: dict, retry_after: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 429
+    response.url = "https://api.coingecko.com/api/v3/simple/price"
+    response._content = json.dumps(body).encode("utf-8")
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_coingecko_rate_limit_throttles_and_raises_http_error():
+    registry = Metrics()
+    limiter = RateLimiter("test", rate=100, burst=10, throttle_pause=30)
+    api = CoinGeckoAPI()
+    client = RateLimitedClient(InstrumentedClient(api, provider="coingecko", registry=registry), limiter)
+    body = {"status": {"error_code": 429, "error_message": "You've exceeded the Rate Limit."}}
+    with mock.patch.object(api.session, "get", return_value=rate_limit_response(body, retry_after="5")):
+        with pytest.raises(requests.exceptions.HTTPError) as raised:
+            client.get_price(ids="bitcoin", vs_currencies="eur")
+
+    assert raised.value.response.status_code == 429
+    assert 4 < limiter._paused_until - monotonic() <= 5
+    assert registry.counters["api_rate_limited_total"]
+
+
+def test_rate_limit_error_payload():
+    assert is_rate_limit_error(ValueError({"status": {"error_code": 429}}))
+    assert is_rate_limit_error(ValueError({"error_code": 429}))
+    assert not is_rate_limit_error(ValueError({"error": "coin not found"}))
+    assert not is_rate_limit_error(ValueError("429"))
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from trade_log import Trade, TradeLog
+
+COLUMNS = [
+    "date",
+    "id",
+    "buy_symbol",
+    "sell_symbol",
+    "price",
+    "amount",
+    "cost",
+    "fee",
+    "fee_symbol",
+    "cost_total",
+    "cost_eur",
+    "exchange",
+]
+
+
+def make_trade(date: str, id: str, buy_symbol: str, fee_symbol: str = "BNB") -> Trade:
+    return Trade(
+        date=pd.Timestamp(date, tz="Europe/Berlin"),
+        id=id,
+        buy_symbol=buy_symbol,
+        sell_symbol="EUR",
+        price=2.0,
+        amount=5.0,
+        cost=10.0,
+        fee=0.1,
+        fee_symbol=fee_symbol,
+        base_cost=10.1,
+        exchange="binance",
+    )
+
+
+def test_append_to_frame_round_trip():
+    trades = [
+        make_trade("2023-01-01 12:00:00", "1", "BTC"),
+        make_trade("2023-01-02 12:00:00", "2", "ETH", fee_symbol=""),
+        make_trade("2023-01-03 12:00:00", "3", "BTC"),
+    ]
+    trade_log = TradeLog(COLUMNS, capacity=1)
+    for trade in trades:
+        trade_log.append(trade, "cost_eur")
+
+    frame = trade_log.to_frame()
+    expected = pd.DataFrame.from_records([trade.as_record("cost_eur") for trade in trades], columns=COLUMNS)
+    expected["date"] = pd.to_datetime(expected["date"], utc=True)
+    assert len(trade_log) == 3
+    assert list(frame.columns) == COLUMNS
+    categories = ["buy_symbol", "sell_symbol", "fee_symbol", "exchange"]
+    assert all(isinstance(frame[column].dtype, pd.CategoricalDtype) for column in categories)
+    frame = frame.astype({column: object for column in categories})
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False)
+
+
+def test_from_frame_append_keeps_categories():
+    trade_log = TradeLog.from_frame(TradeLog(COLUMNS).to_frame())
+    trade_log.append(make_trade("2023-01-01 12:00:00", "1", "BTC"), "cost_eur")
+    trade_log = TradeLog.from_frame(trade_log.to_frame())
+    trade_log.append(make_trade("2023-01-02 12:00:00", "2", "BTC"), "cost_eur")
+
+    frame = trade_log.to_frame()
+    assert list(frame["buy_symbol"].astype(str)) == ["BTC", "BTC"]
+    assert list(frame["buy_symbol"].cat.categories) == ["BTC"]
+    np.testing.assert_allclose(frame["cost_eur"], [10.1, 10.1])
+
+
+def test_sort_by_date():
+    trade_log = TradeLog(COLUMNS)
+    for date, id in [("2023-01-03", "3"), ("2023-01-01", "1"), ("2023-01-02", "2")]:
+        trade_log.append(make_trade(f"{date} 12:00:00", id, "BTC"), "cost_eur")
+    trade_log.sort_by_date()
+
+    assert list(trade_log.column("id")) == ["1", "2", "3"]
+    assert trade_log.column("date").is_monotonic_increasing
+
+
+def test_last_date():
+    trade_log = TradeLog(COLUMNS)
+    assert trade_log.last_date is None
+    for date, id in [("2023-01-02", "2"), ("2023-01-01", "1")]:
+        trade_log.append(make_trade(f"{date} 12:00:00", id, "BTC"), "cost_eur")
+    assert trade_log.last_date == pd.Timestamp("2023-01-02 12:00:00", tz="Europe/Berlin")
+    trade_log.sort_by_date()
+    assert trade_log.last_date == pd.Timestamp("2023-01-02 12:00:00", tz="Europe/Berlin")
+    assert TradeLog.from_frame(trade_log.to_frame()).last_date == trade_log.last_date